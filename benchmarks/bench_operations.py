@@ -0,0 +1,328 @@
+"""Operation benchmarks for gitstaller against generated local repositories
+
+Generates bare repositories of configurable size, history depth, tag count
+and Makefile cost, serves them over ``file://`` or a local ``git daemon``,
+and times install, update, reinstall, tag resolution and metadata
+operations at several package counts. Reports are written as JSON so runs
+on different revisions can be compared with --compare.
+
+Builds run ``sudo make install`` (or unpack an artifact with sudo), so
+--build needs passwordless sudo; without it packages are installed with
+--manual and only the git side is measured.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'gitstaller.py')
+sys.path.insert(0, ROOT)
+
+import gitstaller  # noqa: E402
+
+COMMITTER = 'Bench <bench@example.com> 1700000000 +0000'
+
+def tag_name(index):
+    """Version-like tag names with mixed digit widths, e.g. v1.2.10"""
+    return f"v{index // 100}.{(index // 10) % 10}.{index % 10 + index // 50}"
+
+def _blob(data):
+    return b'data %d\n%s\n' % (len(data), data)
+
+def fast_import_stream(name, options, commits, parent=None, first=0):
+    """fast-import input for ``commits`` commits on main, tagging the initial history"""
+    rng = random.Random(f"{name}-{first}")
+    out = []
+    for index in range(first, first + commits):
+        out.append(b'commit refs/heads/main\nmark :%d\n' % (index + 1))
+        out.append(f'committer {COMMITTER}\n'.encode())
+        out.append(_blob(f'{name} commit {index}'.encode()))
+        if index == first and parent:
+            out.append(f'from {parent}\n'.encode())
+        if index == 0:
+            out.append(b'M 100644 inline Makefile\n' + _blob(makefile(name, options).encode()))
+            for number in range(options.files):
+                out.append(b'M 100644 inline src/f%04d.dat\n' % number)
+                out.append(_blob(rng.randbytes(options.file_size)))
+        else:
+            out.append(b'M 100644 inline src/f%04d.dat\n' % (index % options.files))
+            out.append(_blob(rng.randbytes(options.file_size)))
+        out.append(b'\n')
+    if first == 0:
+        for number in range(options.tags):
+            mark = min(commits, number * commits // max(1, options.tags) + 1)
+            out.append(f'reset refs/tags/{tag_name(number)}\nfrom :{mark}\n\n'.encode())
+    return b''.join(out)
+
+def makefile(name, options):
+    """A Makefile whose build takes about --make-seconds and installs under PREFIX"""
+    sleep = f"\tsleep {options.make_seconds}\n" if options.make_seconds else ""
+    return (f"PREFIX ?= {options.prefix}\n"
+            "all: build.out\n"
+            "build.out: $(wildcard src/*)\n"
+            f"{sleep}\tcat src/* > build.out\n"
+            "install:\n"
+            f"\tmkdir -p $(DESTDIR)$(PREFIX)/share/{name}\n"
+            f"\tcp build.out $(DESTDIR)$(PREFIX)/share/{name}/\n")
+
+def create_remote(remote_dir, name, options):
+    """Create the bare repository remote_dir/<name>.git"""
+    path = os.path.join(remote_dir, f'{name}.git')
+    subprocess.run(['git', 'init', '-q', '--bare', '-b', 'main', path], check=True)
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=path, check=True,
+                   input=fast_import_stream(name, options, options.commits))
+    return path
+
+def push_commit(remote_path, name, options, serial):
+    """Append one commit to main of a fixture remote"""
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=remote_path, check=True,
+                   input=fast_import_stream(name, options, 1, 'refs/heads/main^0',
+                                            first=options.commits + serial))
+
+@contextlib.contextmanager
+def serve(remote_dir, transport):
+    """Yield the base URL of the fixture remotes, running git daemon if asked"""
+    if transport == 'file':
+        yield f'file://{remote_dir}'
+        return
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    daemon = subprocess.Popen(['git', 'daemon', '--reuseaddr', '--export-all',
+                               f'--base-path={remote_dir}', '--listen=127.0.0.1',
+                               f'--port={port}', remote_dir],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', port)):
+                break
+            time.sleep(0.05)
+        yield f'git://127.0.0.1:{port}'
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+def run_cli(home, *args):
+    """Run the gitstaller CLI with its own HOME; returns wall-clock seconds"""
+    env = dict(os.environ, HOME=home)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-W', 'ignore', SCRIPT, *args], env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+@contextlib.contextmanager
+def home_dir(path):
+    """Point HOME (and so ~/.gitstaller) at path for in-process measurements"""
+    previous = os.environ.get('HOME')
+    os.environ['HOME'] = path
+    try:
+        yield
+    finally:
+        os.environ['HOME'] = previous
+
+def bench_cli(workdir, base_url, names, remotes, options, record):
+    """Time install, no-op update, update of new commits and reinstall of N packages"""
+    count = len(names)
+    manifest = os.path.join(workdir, f'manifest-{count}.txt')
+    with open(manifest, 'w') as f:
+        f.writelines(f'{base_url}/{name}.git\n' for name in names)
+    build = [] if options.build else ['-m']
+    parallel = ['-p', str(options.parallel)]
+
+    for run in range(options.runs):
+        home = tempfile.mkdtemp(prefix='home-', dir=workdir)
+        if count == 1:
+            record('install', count, run_cli(home, 'install', f'{base_url}/{names[0]}.git', *build))
+        else:
+            record('install', count, run_cli(home, 'install', '--manifest', manifest,
+                                             *parallel, *build))
+        record('update (no changes)', count,
+               run_cli(home, 'update', '--all', *parallel, *build))
+        for name in names:
+            push_commit(remotes[name], name, options, serial=run)
+        # --refresh, or the ref cache would still report the pre-push commits
+        record('update (new commits)', count,
+               run_cli(home, '--refresh', 'update', '--all', *parallel, *build))
+        record('reinstall (one package)', count,
+               run_cli(home, 'reinstall', names[0], *build))
+
+def bench_latest_tag(base_url, names, options, record):
+    """Time _get_latest_tag on one remote, and resolve_latest_tags over all N"""
+    with tempfile.TemporaryDirectory() as home, home_dir(home):
+        # A zero TTL keeps the on-disk ref cache from answering later runs
+        installer = gitstaller.Gitstaller(use_mirrors=False, ref_cache_ttl=0)
+        url = f'{base_url}/{names[0]}.git'
+        for _ in range(options.runs):
+            installer._ls_remote_cache.clear()
+            start = time.perf_counter()
+            installer._get_latest_tag(url)
+            record('_get_latest_tag', 1, time.perf_counter() - start)
+        if len(names) > 1:
+            urls = [f'{base_url}/{name}.git' for name in names]
+            for _ in range(options.runs):
+                installer._ls_remote_cache.clear()
+                start = time.perf_counter()
+                installer.resolve_latest_tags(urls)
+                record('resolve_latest_tags', len(names), time.perf_counter() - start)
+
+def synthetic_metadata(count):
+    """Metadata of ``count`` installed packages, shaped like real entries"""
+    return {
+        f'pkg{i:05d}': {
+            "url": f"https://example.com/org/pkg{i:05d}.git", "source": "main",
+            "manual": False, "commit": f"{i:040x}", "version": f"{i:012x}",
+            "build_hash": f"{i:064x}",
+            "timings": {"clone": 0.5, "checkout": 0.1, "make": 2.0, "make install": 0.2},
+        } for i in range(count)
+    }
+
+def bench_metadata(count, options, record):
+    """Time looking up one package, loading all and recording one and many, for each backend"""
+    for backend in ('json', 'sqlite'):
+        with tempfile.TemporaryDirectory() as home, home_dir(home):
+            seed = gitstaller.Gitstaller(metadata_backend=backend)
+            seed.metadata  # opens the store
+            seed.store.save(synthetic_metadata(count))
+            for run in range(options.runs):
+                # Single-package commands such as update <name> read one entry
+                installer = gitstaller.Gitstaller(metadata_backend=backend)
+                start = time.perf_counter()
+                installer._get_package('pkg00000')
+                record(f'metadata lookup ({backend})', count, time.perf_counter() - start)
+                installer = gitstaller.Gitstaller(metadata_backend=backend)
+                start = time.perf_counter()
+                installer.metadata
+                record(f'metadata load ({backend})', count, time.perf_counter() - start)
+                entry = dict(installer.metadata['pkg00000'], commit=f'{run + 1:040x}')
+                start = time.perf_counter()
+                installer._set_package('pkg00000', entry)
+                record(f'metadata record ({backend})', count, time.perf_counter() - start)
+                # A bulk operation such as update --all records many packages at once
+                names = sorted(installer.metadata)[:100]
+                start = time.perf_counter()
+                with installer._batched_metadata():
+                    for name in names:
+                        installer._set_package(
+                            name, dict(installer.metadata[name], commit=f'{run + 2:040x}'))
+                record(f'metadata record x{len(names)} ({backend})', count,
+                       time.perf_counter() - start)
+
+def revision():
+    """Short commit of the gitstaller checkout, marked when it has local changes"""
+    def git(*args):
+        return subprocess.run(['git', '-C', ROOT, *args], capture_output=True,
+                              text=True).stdout.strip()
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    return commit + ('-dirty' if git('status', '--porcelain', '--', 'gitstaller.py') else '')
+
+def print_report(report, baseline=None, threshold=None):
+    """Print medians, with the change against a baseline report when given; returns regressions"""
+    base = {(r['operation'], r['packages']): r for r in (baseline or {}).get('results', [])}
+    regressions = []
+    header = f"{'operation':<28}{'packages':>9}{'median':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'change':>9}"
+        print(f"{report['revision']} vs {baseline['revision']}")
+    print(header)
+    for result in report['results']:
+        line = (f"{result['operation']:<28}{result['packages']:>9}"
+                f"{result['median'] * 1000:>10.1f}ms")
+        previous = base.get((result['operation'], result['packages']))
+        if previous:
+            change = (result['median'] - previous['median']) / previous['median'] * 100
+            line += f"{previous['median'] * 1000:>10.1f}ms{change:>+8.1f}%"
+            if threshold is not None and change > threshold:
+                line += '  ❌'
+                regressions.append(result)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gitstaller operations on local fixtures')
+    parser.add_argument('--packages', default='1,10,100',
+                        help='Comma-separated package counts (default: 1,10,100)')
+    parser.add_argument('--metadata-packages', default='1,100,1000,10000',
+                        help='Package counts for the metadata benchmarks')
+    parser.add_argument('--files', type=int, default=20, help='Files per repository')
+    parser.add_argument('--file-size', type=int, default=4096, help='Bytes per file')
+    parser.add_argument('--commits', type=int, default=50, help='History depth per repository')
+    parser.add_argument('--tags', type=int, default=30, help='Tags per repository')
+    parser.add_argument('--make-seconds', type=float, default=0,
+                        help='Extra time each Makefile build takes')
+    parser.add_argument('--build', action='store_true',
+                        help='Build and install packages (needs passwordless sudo)')
+    parser.add_argument('--transport', choices=['file', 'daemon'], default='file',
+                        help='Serve fixtures over file:// or a local git daemon')
+    parser.add_argument('-p', '--parallel', type=int, default=8,
+                        help='Concurrency passed to install and update --all')
+    parser.add_argument('-n', '--runs', type=int, default=3, help='Runs per measurement')
+    parser.add_argument('--workdir', help='Keep fixtures and homes here instead of a temp dir')
+    parser.add_argument('-o', '--output', help='Write the report as JSON')
+    parser.add_argument('--compare', metavar='REPORT', help='Baseline JSON report to compare with')
+    parser.add_argument('--fail-over', type=float, metavar='PERCENT',
+                        help='Exit non-zero when a median regresses by more than PERCENT')
+    options = parser.parse_args()
+    counts = sorted(int(n) for n in options.packages.split(',') if n)
+    metadata_counts = sorted(int(n) for n in options.metadata_packages.split(',') if n)
+
+    samples = {}
+    def record(operation, packages, seconds):
+        samples.setdefault((operation, packages), []).append(seconds)
+
+    with contextlib.ExitStack() as stack:
+        workdir = options.workdir or stack.enter_context(
+            tempfile.TemporaryDirectory(prefix='gitstaller-bench-'))
+        os.makedirs(workdir, exist_ok=True)
+        options.prefix = os.path.join(workdir, 'prefix')
+        remote_dir = os.path.join(workdir, 'remotes')
+        os.makedirs(remote_dir, exist_ok=True)
+
+        names = [f'bench{i:05d}' for i in range(max(counts, default=0))]
+        print(f"⏳ Generating {len(names)} repositories...")
+        remotes = {name: create_remote(remote_dir, name, options) for name in names}
+        base_url = stack.enter_context(serve(remote_dir, options.transport))
+
+        for count in counts:
+            print(f"⏳ Benchmarking {count} package(s)...")
+            # Later package counts reuse the remotes, so they also carry earlier pushes
+            bench_cli(workdir, base_url, names[:count], remotes, options, record)
+            bench_latest_tag(base_url, names[:count], options, record)
+        for count in metadata_counts:
+            print(f"⏳ Benchmarking metadata of {count} package(s)...")
+            bench_metadata(count, options, record)
+
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "parameters": {key: value for key, value in vars(options).items()
+                       if key not in ('output', 'compare', 'fail_over', 'workdir')},
+        "results": [
+            {"operation": operation, "packages": packages,
+             "median": statistics.median(times), "min": min(times), "runs": len(times)}
+            for (operation, packages), times in samples.items()
+        ],
+    }
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != report['parameters']:
+            print("⚠️ Baseline was run with different parameters")
+    regressions = print_report(report, baseline, options.fail_over)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
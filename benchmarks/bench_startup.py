@@ -0,0 +1,70 @@
+"""Startup-time benchmark for the gitstaller CLI
+
+Runs ``gitstaller.py --help`` and a metadata-free command several times and
+reports the median wall-clock time. Exits non-zero when the median exceeds
+--max-ms or when importing gitstaller pulls in modules that should only be
+loaded by the subcommands that need them.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'gitstaller.py')
+
+# Modules that must stay out of the import path of every command
+DEFERRED_MODULES = ('git', 'distutils', 'sqlite3', 'asyncio', 'platform')
+
+def time_command(command, runs, env):
+    """Median wall-clock time in milliseconds of running command"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def eagerly_imported(env):
+    """Deferred modules that are loaded by a plain `import gitstaller`"""
+    check = ("import sys, gitstaller; "
+             f"print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', check], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return output.split()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gitstaller CLI startup time')
+    parser.add_argument('-n', '--runs', type=int, default=20, help='Runs per command')
+    parser.add_argument('--max-ms', type=float, default=150.0,
+                        help='Fail if any median exceeds this many milliseconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # A throwaway HOME keeps the benchmark away from real metadata
+        env = dict(os.environ, HOME=home, PYTHONDONTWRITEBYTECODE='1')
+        results = {
+            'python -c pass': time_command([sys.executable, '-c', 'pass'], args.runs, env),
+            'gitstaller --help': time_command([sys.executable, SCRIPT, '--help'], args.runs, env),
+            'gitstaller (no command)': time_command([sys.executable, SCRIPT], args.runs, env),
+        }
+        leaked = eagerly_imported(env)
+
+    failed = False
+    for name, median in results.items():
+        marker = ''
+        if name.startswith('gitstaller') and median > args.max_ms:
+            marker = f'  ❌ over {args.max_ms:.0f} ms'
+            failed = True
+        print(f"{name:<26}{median:8.1f} ms{marker}")
+    if leaked:
+        print(f"❌ Importing gitstaller loads deferred modules: {', '.join(leaked)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,181 +1,2453 @@
 import os
 import argparse
+import atexit
+import fcntl
+import fnmatch
+import hashlib
 import json
+import re
 import subprocess
-from git import Repo, GitCommandError, Git
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from shutil import rmtree
-from distutils.version import LooseVersion
 
-class Gitstaller:
+# Environment variables that affect build output and so invalidate previous builds
+BUILD_ENV_VARS = ('CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'PREFIX')
+
+# ioctl that clones a file's extents copy-on-write (Linux btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Number of installed versions kept per package for switching back
+KEEP_VERSIONS = 3
+
+# Size limit for ~/.gitstaller/mirrors before least recently used mirrors are evicted
+MIRROR_CACHE_SIZE = int(os.environ.get('GITSTALLER_MIRROR_CACHE_MB', 10240)) * 1024 * 1024
+
+# Seconds an ls-remote result is reused within one run
+LS_REMOTE_TTL = 60
+
+# Seconds between metadata writes while a bulk operation records many packages
+METADATA_FLUSH_INTERVAL = 2
+
+# Concurrent network commands per remote host in the async engine
+PER_HOST_LIMIT = 8
+
+# Seconds resolved remote refs are trusted across runs before they are checked again
+REF_CACHE_TTL = int(os.environ.get('GITSTALLER_REF_CACHE_TTL', 300))
+
+# Reuse one SSH connection per host for the many ls-remote calls of a batch
+SSH_MULTIPLEX = ('ssh -o ControlMaster=auto -o ControlPersist=60 '
+                 '-o ControlPath=~/.gitstaller/ssh-%C')
+
+# Version tags: optional alphabetic prefix, numeric release, then semver/PEP 440
+# style pre-release, post-release, dev and build metadata parts. A release
+# without dots needs a standalone v (v2), so build numbers and dates such as
+# nightly-20240101 or build42 are not versions.
+VERSION_TAG = re.compile(r"""
+    ^(?:[A-Za-z]+(?:[-_/.][A-Za-z]+)*[-_/]?)?
+    (?:(?<![A-Za-z])v(?=\d)|(?=\d+\.\d))
+    (?P<release>\d+(?:\.\d+)*)
+    (?:[-_.]?(?P<pre>alpha|a|beta|b|preview|pre|rc|c)[-_.]?(?P<pre_n>\d+)?)?
+    (?:[-_.]?(?:post|rev|r)[-_.]?(?P<post>\d+))?
+    (?P<dev>[-_.]?dev[-_.]?(?P<dev_n>\d+)?)?
+    (?:\+[\w.]*)?$
+""", re.VERBOSE | re.IGNORECASE)
+
+PRE_RELEASE_RANKS = {'alpha': 0, 'a': 0, 'beta': 1, 'b': 1,
+                     'preview': 2, 'pre': 2, 'rc': 2, 'c': 2}
+
+def version_key(tag):
+    """Sort key of a version tag, or None if the tag is not a version
+
+    Orders like PEP 440: 1.0.dev1 < 1.0a1 < 1.0b2 < 1.0rc1 < 1.0 < 1.0.post1,
+    and 1.0 == 1.0.0. The second element is True for pre-releases.
+    """
+    match = VERSION_TAG.match(tag)
+    if not match:
+        return None
+    release = tuple(int(part) for part in match['release'].split('.'))
+    while len(release) > 1 and release[-1] == 0:
+        release = release[:-1]
+    pre, post, dev = match['pre'], match['post'], match['dev']
+    if pre:
+        pre_key = (PRE_RELEASE_RANKS[pre.lower()], int(match['pre_n'] or 0))
+    elif dev and not post:
+        pre_key = (-1, 0)  # 1.0.dev1 comes before 1.0a1
+    else:
+        pre_key = (3, 0)
+    dev_key = (0, int(match['dev_n'] or 0)) if dev else (1, 0)
+    key = (release, pre_key, int(post) if post else -1, dev_key)
+    return key, bool(pre or dev)
+
+def latest_version(tags, pattern=None, prereleases=False):
+    """Newest version among tag names, in one pass without sorting
+
+    Tags that don't look like versions or don't match the glob
+    ``pattern`` are ignored, as are pre-releases unless requested.
+    """
+    matches = re.compile(fnmatch.translate(pattern)).match if pattern else None
+    best = best_key = None
+    for tag in tags:
+        if matches and not matches(tag):
+            continue
+        parsed = version_key(tag)
+        if parsed is None or (parsed[1] and not prereleases):
+            continue
+        # The tag name breaks ties such as v1.0 and 1.0.0 deterministically
+        key = (parsed[0], tag)
+        if best_key is None or key > best_key:
+            best, best_key = tag, key
+    return best
+
+def _read_first_line(path):
+    """Return the first line of a file, or None if it can't be read"""
+    try:
+        with open(path, 'r') as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+def _cgroup_paths():
+    """(cgroup v2 path, cgroup v1 cpu controller path) of this process, None where absent"""
+    v2 = v1 = None
+    try:
+        with open('/proc/self/cgroup', 'r') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return v2, v1
+    for line in lines:
+        hierarchy, controllers, path = (line.split(':', 2) + ['', ''])[:3]
+        if hierarchy == '0' and not controllers:
+            v2 = path
+        elif 'cpu' in controllers.split(','):
+            v1 = path
+    return v2, v1
+
+def _cgroup_dirs(root, path):
+    """root/path and its ancestors up to root, innermost first
+
+    Without a cgroup namespace, /proc/self/cgroup shows the host's path
+    while root is the container's own cgroup; missing directories are
+    skipped so that the quota is read from root then.
+    """
+    parts = [part for part in (path or '').split('/') if part]
+    for depth in range(len(parts), -1, -1):
+        directory = os.path.join(root, *parts[:depth])
+        if os.path.isdir(directory):
+            yield directory
+
+def available_cpus():
+    """Number of CPUs this process may use, honoring affinity and cgroup quotas
+
+    The quota of the process's own cgroup and of each of its ancestors
+    applies; the tightest one wins.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2 exposes "<quota> <period>", v1 splits them over two files
+    quotas = []
+    v2, v1 = _cgroup_paths()
+    if v2 is not None:
+        for directory in _cgroup_dirs('/sys/fs/cgroup', v2):
+            fields = (_read_first_line(os.path.join(directory, 'cpu.max')) or '').split()
+            if len(fields) == 2 and fields[0] != 'max':
+                quotas.append((int(fields[0]), int(fields[1])))
+    if v1 is not None:
+        for directory in _cgroup_dirs('/sys/fs/cgroup/cpu', v1):
+            v1_quota = _read_first_line(os.path.join(directory, 'cpu.cfs_quota_us'))
+            v1_period = _read_first_line(os.path.join(directory, 'cpu.cfs_period_us'))
+            if v1_quota and v1_period and int(v1_quota) > 0:
+                quotas.append((int(v1_quota), int(v1_period)))
+    for quota, period in quotas:
+        if quota and period:
+            cpus = min(cpus, -(-quota // period))
+    return max(1, cpus)
+
+def url_host(repo_url):
+    """Host of a git URL, or '' for local paths and file:// URLs"""
+    if '://' in repo_url:
+        from urllib.parse import urlsplit
+        return urlsplit(repo_url).hostname or ''
+    head = repo_url.split('/', 1)[0]
+    if ':' in head:  # scp-like user@host:path
+        return head.split(':', 1)[0].rpartition('@')[2]
+    return ''
+
+def tag_prefix(pattern):
+    """Ref prefix covering every tag that can match a glob, e.g. refs/tags/v for v*"""
+    literal = re.split(r'[*?\[]', pattern or '', maxsplit=1)[0]
+    return 'refs/tags/' + literal
+
+def _pkt_line(text):
+    """Frame text as a git protocol pkt-line"""
+    data = text.encode()
+    return b'%04x' % (len(data) + 4) + data
+
+def ls_refs_request(prefixes):
+    """Protocol v2 ls-refs command listing only refs under the given prefixes"""
+    lines = [_pkt_line(f'ref-prefix {prefix}\n') for prefix in prefixes]
+    return (_pkt_line('command=ls-refs\n') + b'0001' + _pkt_line('peel\n')
+            + b''.join(lines) + b'0000')
+
+def parse_ls_refs(output):
+    """Map of ref names to commit SHAs from a v2 capability advertisement and ls-refs reply
+
+    Raises ValueError when the server did not answer in protocol v2,
+    so that callers can fall back to a plain ls-remote.
+    """
+    if isinstance(output, str):
+        output = output.encode()
+    refs = {}
+    sections = [[]]
+    pos = 0
+    while pos < len(output) and len(sections) < 3:
+        length = int(output[pos:pos + 4], 16)
+        if length < 4:  # flush, delim or response-end packet
+            if length == 0:
+                sections.append([])
+            pos += 4
+            continue
+        sections[-1].append(output[pos + 4:pos + length].decode().rstrip('\n'))
+        pos += length
+
+    if 'version 2' not in sections[0] or len(sections) < 3:
+        raise ValueError('remote did not answer in protocol v2')
+    for line in sections[1]:
+        if line.startswith('ERR '):
+            raise ValueError(line[4:])
+        sha, ref, *attributes = line.split(' ')
+        for attribute in attributes:
+            if attribute.startswith('peeled:'):
+                sha = attribute[len('peeled:'):]
+        refs[ref] = sha
+    return refs
+
+_ssh_config = []
+
+def configured_ssh_command():
+    """The user's ssh command from GIT_SSH_COMMAND or core.sshCommand, or None"""
+    if 'GIT_SSH_COMMAND' in os.environ:
+        return os.environ['GIT_SSH_COMMAND']
+    if not _ssh_config:
+        result = subprocess.run(['git', 'config', '--get', 'core.sshCommand'],
+                                capture_output=True, text=True)
+        _ssh_config.append(result.stdout.strip() or None)
+    return _ssh_config[0]
+
+def ssh_multiplex_env():
+    """GIT_SSH_COMMAND for connection reuse, unless the user configured ssh themselves"""
+    if configured_ssh_command() is not None or 'GIT_SSH' in os.environ:
+        return {}
+    return {'GIT_SSH_COMMAND': SSH_MULTIPLEX}
+
+def ls_refs_command(repo_url):
+    """(args, handshake) of a process speaking protocol v2 to repo_url's upload-pack
+
+    HTTP goes through git's remote helper, which has to acknowledge the
+    stateless-connect handshake line before it accepts pkt-lines.
+
+    Returns None for transports this can't be done over, such as git://,
+    and for ssh programs other than OpenSSH, whose options may differ.
+    """
+    import shlex
+    from urllib.parse import urlsplit
+    scheme = repo_url.split('://', 1)[0] if '://' in repo_url else ''
+    if scheme in ('http', 'https'):
+        return (['git', f'remote-{scheme}', repo_url, repo_url],
+                b'stateless-connect git-upload-pack\n')
+
+    if scheme == 'file' or (not scheme and not url_host(repo_url)):
+        path = urlsplit(repo_url).path if scheme else repo_url
+        return ['git', 'upload-pack', path], None
+
+    if scheme == 'ssh':
+        parts = urlsplit(repo_url)
+        login = parts.hostname if not parts.username else f'{parts.username}@{parts.hostname}'
+        port = ['-p', str(parts.port)] if parts.port else []
+        path = parts.path
+    elif not scheme:
+        login, _, path = repo_url.partition(':')
+        port = []
+    else:
+        return None
+    if "'" in path:
+        return None
+    command = configured_ssh_command()
+    if command is None:
+        if 'GIT_SSH' in os.environ:
+            return None
+        command = SSH_MULTIPLEX
+    words = shlex.split(command)
+    if not words or os.path.basename(words[0]) != 'ssh':
+        return None
+    # Like git, run the command through the shell so its quoting and ~ apply
+    return (['sh', '-c', command + ' "$@"', 'ssh', '-o', 'SendEnv=GIT_PROTOCOL', *port,
+             login, f"git-upload-pack '{path}'"], None)
+
+class CommandRunner:
+    """Runs many commands as asyncio subprocesses from one thread
+
+    At most ``limit`` commands run at once, and at most ``per_host`` of
+    them against the same remote host. Commands that exceed ``timeout``
+    seconds, or whose task is cancelled (e.g. by Ctrl-C), are killed.
+    """
+
+    def __init__(self, limit=64, per_host=PER_HOST_LIMIT, timeout=None):
+        self.limit = limit
+        self.per_host = per_host
+        self.timeout = timeout
+        self._slots = None
+        self._host_slots = {}
+
+    def gather(self, coroutines, limit=None):
+        """Run coroutines concurrently; returns their results or exceptions in order"""
+        import asyncio
+
+        async def main():
+            # Semaphores belong to the event loop they are created in
+            self._slots = asyncio.Semaphore(max(1, limit or self.limit))
+            self._host_slots = {}
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+        return asyncio.run(main())
+
+    async def run(self, args, host='', timeout=None, cwd=None, env=None, input=None,
+                  handshake=None):
+        """Run a command and return its stdout, raising CalledProcessError on failure
+
+        A ``handshake`` line is written first and must be acknowledged with
+        an empty line before ``input`` is sent, as git remote helpers do.
+        """
+        import asyncio
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(max(1, self.per_host))
+        timeout = timeout or self.timeout
+        async with self._slots, self._host_slots[host]:
+            process = await asyncio.create_subprocess_exec(
+                *args, cwd=cwd, env=env,
+                stdin=asyncio.subprocess.DEVNULL if input is None else asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+            async def communicate():
+                if handshake:
+                    process.stdin.write(handshake)
+                    if await process.stdout.readline() != b'\n':
+                        raise subprocess.CalledProcessError(1, args, '', 'handshake refused')
+                return await process.communicate(input)
+            try:
+                stdout, stderr = await asyncio.wait_for(communicate(), timeout)
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(args, timeout)
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, args,
+                                                stdout.decode(), stderr.decode())
+        return stdout.decode()
+
+class JobBudget:
+    """Counting budget of build jobs shared by concurrent builds
+
+    A build reserves as many slots as it passes to ``make -j`` so that
+    several builds running at once never oversubscribe the machine.
+    """
+
+    def __init__(self, total):
+        self.total = max(1, total)
+        self._available = self.total
+        self._condition = threading.Condition()
+
+    def acquire(self, jobs):
+        """Wait until ``jobs`` slots are free and take them; returns the slots taken"""
+        jobs = min(max(1, jobs), self.total)
+        with self._condition:
+            self._condition.wait_for(lambda: self._available >= jobs)
+            self._available -= jobs
+        return jobs
+
+    def release(self, jobs):
+        """Return previously acquired slots to the budget"""
+        with self._condition:
+            self._available += jobs
+            self._condition.notify_all()
+
+class PhaseTimer:
+    """Thread-safe record of how long each package spent in each phase
+
+    Spans can be written as JSON lines or as a Chrome trace
+    (chrome://tracing, Perfetto) to see where provisioning time goes.
+    """
+
     def __init__(self):
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._epoch = time.time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, package, name):
+        """Time the enclosed block as phase ``name`` of ``package``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({
+                    "package": package, "phase": name,
+                    "start": self._epoch + (start - self._origin),
+                    "seconds": end - start,
+                    "thread": threading.get_ident(),
+                })
+
+    def for_package(self, package):
+        """Total seconds per phase recorded for a package"""
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                if span['package'] == package:
+                    totals[span['phase']] = totals.get(span['phase'], 0.0) + span['seconds']
+        return {phase: round(seconds, 3) for phase, seconds in totals.items()}
+
+    def write_jsonl(self, path):
+        """Write one JSON object per span"""
+        with open(path, 'w') as f:
+            for span in self.spans:
+                f.write(json.dumps(span) + '\n')
+
+    def write_chrome_trace(self, path):
+        """Write spans in the Chrome trace event format, one track per worker thread"""
+        threads = {}
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": f"{span['package']}: {span['phase']}", "cat": span['phase'], "ph": "X",
+                "ts": round((span['start'] - self._epoch) * 1e6),
+                "dur": round(span['seconds'] * 1e6),
+                "pid": os.getpid(), "tid": threads.setdefault(span['thread'], len(threads) + 1),
+                "args": {"package": span['package']},
+            })
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """Hold an advisory flock on path, shared between processes and threads
+
+    Yields False instead of waiting when ``blocking`` is off and the lock
+    is held elsewhere.
+    """
+    with open(path, 'a') as f:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(f, flags if blocking else flags | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class JsonMetadataStore:
+    """installed.json backend, written atomically and only when it changed"""
+
+    def __init__(self, path):
+        self.path = path
+        self._written = None
+
+    def load(self):
+        """Return all package entries"""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            self._written = f.read()
+        return json.loads(self._written) if self._written.strip() else {}
+
+    def get(self, name):
+        """Return one package's entry, or None if it is not installed"""
+        return self.load().get(name)
+
+    def save(self, metadata):
+        """Persist all package entries"""
+        data = json.dumps(metadata, indent=2)
+        if data == self._written:
+            return
+        # Write to a temporary file and rename it over the old one so that a
+        # crash leaves either the previous or the new file, never a mix
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.installed-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                os.fchmod(fd, 0o644)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._written = data
+
+    def merge(self, changes):
+        """Apply changed entries, None meaning removed, on top of the stored ones"""
+        merged = self.load()
+        for name, entry in changes.items():
+            if entry is None:
+                merged.pop(name, None)
+            else:
+                merged[name] = entry
+        self.save(merged)
+
+class RefCache:
+    """Remote refs resolved by earlier runs, trusted for ``ttl`` seconds
+
+    Maps a repository URL and a key (a full ref name, or a latest-release
+    query) to what it resolved to. New entries are merged into the file
+    when the process exits.
+    """
+
+    def __init__(self, path, ttl=REF_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries = None
+        self._changed = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, key):
+        """Cached value for url and key, or None if missing or expired"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = JsonMetadataStore(self.path).load()
+            checked, value = self._entries.get(url, {}).get(key, (0, None))
+        return value if time.time() - checked < self.ttl else None
+
+    def put(self, url, key, value):
+        """Remember what url and key resolved to now"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = JsonMetadataStore(self.path).load()
+            if not self._changed:
+                atexit.register(self.save)
+            entry = [time.time(), value]
+            self._entries.setdefault(url, {})[key] = entry
+            self._changed.setdefault(url, {})[key] = entry
+
+    def save(self):
+        """Merge new entries into the cache file"""
+        with self._lock:
+            if not self._changed:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with file_lock(f"{self.path}.lock"):
+                store = JsonMetadataStore(self.path)
+                merged = store.load()
+                for url, entries in self._changed.items():
+                    merged.setdefault(url, {}).update(entries)
+                store.save(merged)
+            self._changed = {}
+
+class SqliteMetadataStore:
+    """installed.db backend keyed by package name
+
+    Saving only upserts and deletes the rows that differ from the last load
+    or save, so touching one package out of thousands writes one row.
+    """
+
+    def __init__(self, path, import_from=None):
+        import sqlite3
+        self.path = path
+        self._written = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS packages (name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        if import_from and os.path.exists(import_from) and not self.load():
+            self.save(JsonMetadataStore(import_from).load())
+
+    def load(self):
+        """Return all package entries"""
+        rows = self._connection.execute("SELECT name, data FROM packages").fetchall()
+        self._written = dict(rows)
+        return {name: json.loads(data) for name, data in rows}
+
+    def get(self, name):
+        """Return one package's entry, or None if it is not installed"""
+        row = self._connection.execute(
+            "SELECT data FROM packages WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, metadata):
+        """Persist all package entries"""
+        rows = {name: json.dumps(entry, sort_keys=True) for name, entry in metadata.items()}
+        changed = [(name, data) for name, data in rows.items() if self._written.get(name) != data]
+        removed = [(name,) for name in self._written if name not in rows]
+        if not changed and not removed:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO packages (name, data) VALUES (?, ?)", changed)
+            self._connection.executemany("DELETE FROM packages WHERE name = ?", removed)
+        self._written = rows
+
+    def merge(self, changes):
+        """Upsert or delete only the changed entries, None meaning removed"""
+        rows = {name: json.dumps(entry, sort_keys=True) for name, entry in changes.items()
+                if entry is not None}
+        removed = [(name,) for name, entry in changes.items() if entry is None]
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO packages (name, data) VALUES (?, ?)", rows.items())
+            self._connection.executemany("DELETE FROM packages WHERE name = ?", removed)
+        self._written.update(rows)
+        for (name,) in removed:
+            self._written.pop(name, None)
+
+class Gitstaller:
+    def __init__(self, use_mirrors=True, mirror_cache_size=MIRROR_CACHE_SIZE, jobs=None,
+                 metadata_backend='json', artifact_dir=None, use_artifacts=True,
+                 use_store=True, ref_cache_ttl=REF_CACHE_TTL, timeout=None,
+                 per_host=PER_HOST_LIMIT, wheel_dir=None):
         self.base_dir = os.path.expanduser("~/.gitstaller")
         self.package_dir = os.path.join(self.base_dir, "packages")
+        self.mirror_dir = os.path.join(self.base_dir, "mirrors")
         self.metadata_file = os.path.join(self.base_dir, "installed.json")
-        self._init_dirs()
-        self._load_metadata()
+        self.metadata_backend = metadata_backend
+        self.artifact_dir = artifact_dir or os.path.join(self.base_dir, "artifacts")
+        self.use_artifacts = use_artifacts
+        self.wheel_dir = wheel_dir or os.path.join(self.base_dir, "wheels")
+        self._python = None
+        self.store_dir = os.path.join(self.base_dir, "store")
+        self.use_store = use_store
+        self._reflinks = None
+        self._store_garbage = False
+        self._pending_versions = {}
+        self._toolchain = None
+        self.use_mirrors = use_mirrors
+        self.mirror_cache_size = mirror_cache_size
+        self._mirror_sizes = None
+        self._mirror_sizes_lock = threading.Lock()
+        self.jobs = jobs
+        self.job_budget = JobBudget(available_cpus())
+        self.metadata_lock_file = os.path.join(self.base_dir, "installed.lock")
+        self._metadata = None
+        self._entries = {}
+        self._metadata_lock = threading.RLock()
+        self._dirty = set()
+        self._metadata_batches = 0
+        self._metadata_flushed = 0
+        self._ls_remote_cache = {}
+        self._ls_remote_lock = threading.Lock()
+        self.ref_cache = RefCache(os.path.join(self.base_dir, "refs.json"), ref_cache_ttl)
+        self.timer = PhaseTimer()
+        self.runner = CommandRunner(per_host=per_host, timeout=timeout)
+
+    @property
+    def metadata(self):
+        """Installed packages metadata, loaded on first use"""
+        if self._metadata is None:
+            with self._metadata_lock:
+                if self._metadata is None:
+                    self._load_metadata()
+        return self._metadata
 
     def _init_dirs(self):
         """Create required directories"""
         os.makedirs(self.package_dir, exist_ok=True)
-        if not os.path.exists(self.metadata_file):
-            with open(self.metadata_file, 'w') as f:
-                json.dump({}, f)
+        os.makedirs(self.mirror_dir, exist_ok=True)
+
+    def _open_store(self):
+        """Create the directories and the metadata store backend on first use"""
+        with self._metadata_lock:
+            if hasattr(self, 'store'):
+                return
+            self._init_dirs()
+            if self.metadata_backend == 'sqlite':
+                self.store = SqliteMetadataStore(
+                    os.path.join(self.base_dir, "installed.db"), import_from=self.metadata_file)
+            else:
+                self.store = JsonMetadataStore(self.metadata_file)
 
     def _load_metadata(self):
         """Load installed packages metadata"""
-        with open(self.metadata_file, 'r') as f:
-            self.metadata = json.load(f)
+        self._open_store()
+        with file_lock(self.metadata_lock_file, shared=True):
+            metadata = self.store.load()
+        # Unsaved changes made through _set_package before the full load
+        for name in self._dirty:
+            if self._entries.get(name) is None:
+                metadata.pop(name, None)
+            else:
+                metadata[name] = self._entries[name]
+        self._metadata = metadata
+        self._entries = {}
+
+    def _get_package(self, package_name):
+        """One package's metadata entry, or None if it is not installed
+
+        Commands on a single package read just its entry rather than
+        loading every installed package.
+        """
+        with self._metadata_lock:
+            if self._metadata is not None:
+                return self._metadata.get(package_name)
+            if package_name not in self._entries:
+                self._open_store()
+                with file_lock(self.metadata_lock_file, shared=True):
+                    self._entries[package_name] = self.store.get(package_name)
+            return self._entries[package_name]
+
+    def _set_package(self, package_name, entry):
+        """Store metadata for a package, None removing it, and persist it (thread-safe)"""
+        with self._metadata_lock:
+            if self._metadata is None:
+                self._entries[package_name] = entry
+            elif entry is None:
+                self._metadata.pop(package_name, None)
+            else:
+                self._metadata[package_name] = entry
+            self._dirty.add(package_name)
+            self._save_metadata()
 
     def _save_metadata(self):
-        """Save metadata to file"""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(self.metadata, f, indent=2)
+        """Merge this process's metadata changes into the store
+
+        Other gitstaller processes may have written since we loaded, so
+        under an exclusive lock only the entries this process added,
+        changed or removed are applied to the stored state. Within a bulk
+        operation this happens at most every METADATA_FLUSH_INTERVAL seconds.
+        """
+        with self._metadata_lock:
+            if not self._dirty or (self._metadata_batches and time.monotonic()
+                                   - self._metadata_flushed < METADATA_FLUSH_INTERVAL):
+                return
+            self._open_store()
+            with file_lock(self.metadata_lock_file):
+                self.store.merge({name: self._get_package(name) for name in self._dirty})
+            self._dirty.clear()
+            self._metadata_flushed = time.monotonic()
+
+    @contextmanager
+    def _batched_metadata(self):
+        """Write the metadata changes of a bulk operation in batches"""
+        with self._metadata_lock:
+            self._metadata_batches += 1
+        try:
+            yield
+        finally:
+            with self._metadata_lock:
+                self._metadata_batches -= 1
+                if not self._metadata_batches:
+                    self._save_metadata()
+
+    def _mirror_path(self, repo_url):
+        """Path of the bare mirror caching objects for repo_url"""
+        digest = hashlib.sha1(repo_url.encode()).hexdigest()[:12]
+        return os.path.join(self.mirror_dir, f"{self._extract_name(repo_url)}-{digest}.git")
+
+    def _ensure_mirror(self, repo_url, ref=None):
+        """Create or refresh the local mirror of repo_url and return its file:// URL
+
+        Only objects missing from the mirror cross the network, so repeated
+        installs, reinstalls and updates of the same URL are incremental.
+        When the caller only needs ``ref`` and the mirror already has it at
+        the remote's commit, the mirror is not fetched at all.
+        """
+        from git import Git
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        mirror_path = self._mirror_path(repo_url)
+        with file_lock(f"{mirror_path}.lock"):
+            if os.path.isdir(mirror_path):
+                mirror = Git(mirror_path)
+                remote_sha = ref and self._resolve_ref(repo_url, ref)
+                if not remote_sha:
+                    mirror.fetch('--prune', 'origin')
+                elif mirror.rev_parse('--verify', '--quiet', f'{ref}^{{commit}}',
+                                      with_exceptions=False) != remote_sha:
+                    mirror.fetch('origin', f'+{ref}:{ref}')
+            else:
+                tmp_path = f"{mirror_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+                Git().clone('--mirror', repo_url, tmp_path)
+                mirror = Git(tmp_path)
+                # Let checkouts be shallow/partial clones of the mirror
+                mirror.config('uploadpack.allowFilter', 'true')
+                mirror.config('uploadpack.allowAnySHA1InWant', 'true')
+                os.rename(tmp_path, mirror_path)
+            os.utime(mirror_path)
+        self._evict_mirrors(keep=mirror_path)
+        return f"file://{mirror_path}"
+
+    def _refresh_mirrors(self, repo_refs, parallel=8):
+        """Fetch the existing mirrors of many URLs concurrently on the async engine
+
+        ``repo_refs`` maps each URL to the one full ref needed from it, or
+        None to fetch everything. Mirrors that don't exist yet, or that
+        another thread or process is fetching, are left to _ensure_mirror.
+        """
+        env = self._async_git_env()
+
+        async def refresh(repo_url, ref):
+            mirror_path = self._mirror_path(repo_url)
+            if not os.path.isdir(mirror_path):
+                return
+            refspec = [f'+{ref}:{ref}'] if ref else ['--prune']
+            with file_lock(f"{mirror_path}.lock", blocking=False) as locked:
+                if locked:
+                    await self.runner.run(['git', 'fetch', 'origin', *refspec],
+                                          host=url_host(repo_url), cwd=mirror_path, env=env)
+                    os.utime(mirror_path)
+
+        urls = list(repo_refs)
+        refreshes = [refresh(url, repo_refs[url]) for url in urls]
+        for repo_url, result in zip(urls, self.runner.gather(refreshes, parallel)):
+            if isinstance(result, Exception):
+                print(f"⚠️ Could not refresh mirror of {repo_url}: {str(result)}")
+
+    def _evict_mirrors(self, keep=None):
+        """Remove least recently used mirrors until the cache fits its size limit
+
+        Mirror sizes are measured once per process; afterwards only ``keep``,
+        the mirror that was just fetched, is measured again.
+        """
+        with self._mirror_sizes_lock:
+            if self._mirror_sizes is None:
+                self._mirror_sizes = {
+                    entry.path: self._dir_size(entry.path) for entry in os.scandir(self.mirror_dir)
+                    if entry.is_dir() and entry.name.endswith('.git')}
+            if keep:
+                self._mirror_sizes[keep] = self._dir_size(keep)
+            if sum(self._mirror_sizes.values()) <= self.mirror_cache_size:
+                return
+
+            mirrors = []
+            for path, size in self._mirror_sizes.items():
+                try:
+                    mirrors.append((os.stat(path).st_mtime, size, path))
+                except OSError:
+                    mirrors.append((0, 0, path))  # removed by another process
+            total = sum(size for _, size, _ in mirrors)
+            for _, size, path in sorted(mirrors):
+                if total <= self.mirror_cache_size:
+                    break
+                if path == keep:
+                    continue
+                # Mirrors in use by another thread or process are skipped
+                with file_lock(f"{path}.lock", blocking=False) as locked:
+                    if not locked:
+                        continue
+                    rmtree(path, ignore_errors=True)
+                del self._mirror_sizes[path]
+                total -= size
+
+    def _dir_size(self, path):
+        """Total size in bytes of the files below path"""
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _clone_source(self, repo_url, ref=None):
+        """URL to clone from: the refreshed local mirror, or repo_url itself"""
+        return self._ensure_mirror(repo_url, ref) if self.use_mirrors else repo_url
+
+    def _clones_from_mirror(self, source, clone=None):
+        """Whether checkouts of this source go through the local mirror
+
+        A mirror holds every commit and blob of the remote, which shallow,
+        single-branch and partial clones exist to avoid downloading, so
+        those clone straight from the remote.
+        """
+        return self.use_mirrors and not self._clone_options(source, clone)
+
+    def _ls_remote(self, repo_url, *patterns, **options):
+        """Map of remote ref names to commit SHAs, cached for LS_REMOTE_TTL seconds
+
+        Annotated tags are reported with the SHA of the commit they point to.
+        """
+        from git import Git
+        key = (repo_url, patterns, tuple(sorted(options.items())))
+        cached = self._cached_ls_remote(key)
+        if cached is not None:
+            return cached
 
-    def _get_latest_tag(self, repo_url):
-        """Get latest release tag from remote repository"""
         g = Git()
-        tags = sorted(g.ls_remote(repo_url, tags=True).split('\n'), 
-                      key=lambda t: LooseVersion(t.split('/')[-1]), 
-                      reverse=True)
-        return tags[0].split('\t')[1].split('/')[-1] if tags else None
+        with g.custom_environment(**ssh_multiplex_env()):
+            output = g.ls_remote(repo_url, *patterns, **options)
+        return self._store_ls_remote(key, output)
+
+    async def _ls_remote_async(self, repo_url, *patterns, **options):
+        """_ls_remote on the async engine, sharing its cache"""
+        key = (repo_url, patterns, tuple(sorted(options.items())))
+        cached = self._cached_ls_remote(key)
+        if cached is not None:
+            return cached
+
+        flags = [f"--{name.replace('_', '-')}" for name, value in options.items() if value]
+        output = await self.runner.run(['git', 'ls-remote', *flags, repo_url, *patterns],
+                                       host=url_host(repo_url), env=self._async_git_env())
+        return self._store_ls_remote(key, output)
+
+    def _async_git_env(self):
+        """Environment for git commands on the async engine, which must never prompt"""
+        return dict(os.environ, GIT_TERMINAL_PROMPT='0', **ssh_multiplex_env())
+
+    def _store_ls_remote(self, key, output):
+        """Parse ls-remote output into a ref map and cache it under key"""
+        refs = {}
+        for line in output.splitlines():
+            sha, _, ref = line.partition('\t')
+            if ref.endswith('^{}'):
+                refs[ref[:-3]] = sha
+            else:
+                refs.setdefault(ref, sha)
+        return self._cache_ls_remote(key, refs)
+
+    def _cached_ls_remote(self, key):
+        """Ref map listed under key less than LS_REMOTE_TTL seconds ago, or None"""
+        with self._ls_remote_lock:
+            cached = self._ls_remote_cache.get(key)
+        if cached and time.monotonic() - cached[0] < LS_REMOTE_TTL:
+            return cached[1]
+        return None
+
+    def _cache_ls_remote(self, key, refs):
+        """Remember a listed ref map under key and return it"""
+        with self._ls_remote_lock:
+            self._ls_remote_cache[key] = (time.monotonic(), refs)
+        return refs
+
+    def _remote_tags(self, repo_url):
+        """Map of remote tag names to commit SHAs"""
+        refs = self._ls_remote(repo_url, tags=True)
+        return {ref[len('refs/tags/'):]: sha for ref, sha in refs.items()
+                if ref.startswith('refs/tags/')}
+
+    def _get_latest_tag(self, repo_url, releases=None):
+        """Get latest release tag from remote repository
+
+        ``releases`` may set a tag glob ``pattern`` and whether
+        ``prereleases`` count as releases.
+        """
+        return self._latest_release(repo_url, releases)[0]
+
+    def _latest_release(self, repo_url, releases=None):
+        """(tag, commit SHA) of the latest release, from the ref cache when fresh"""
+        cached = self.ref_cache.get(repo_url, self._release_key(releases))
+        if cached is not None:
+            return tuple(cached)
+        return self._store_release(repo_url, releases, self._release_tags(repo_url, releases))
+
+    async def _latest_release_async(self, repo_url, releases=None):
+        """_latest_release on the async engine"""
+        cached = self.ref_cache.get(repo_url, self._release_key(releases))
+        if cached is not None:
+            return tuple(cached)
+        refs = await self._release_tags_async(repo_url, releases)
+        return self._store_release(repo_url, releases, refs)
+
+    def _release_tags(self, repo_url, releases=None):
+        """Remote tag refs that can match the release tag pattern
+
+        When the pattern has a literal prefix such as v in v*, ls-refs is
+        spoken directly so the server sends only tags under that prefix;
+        git ls-remote itself always lists every tag. Remotes that can't do
+        this get a plain ls-remote.
+        """
+        prefix = tag_prefix((releases or {}).get('pattern'))
+        command = ls_refs_command(repo_url) if prefix != 'refs/tags/' else None
+        if command is None:
+            return self._ls_remote(repo_url, tags=True)
+
+        key = (repo_url, ('ls-refs', prefix), ())
+        cached = self._cached_ls_remote(key)
+        if cached is not None:
+            return cached
+        try:
+            output = self._run_ls_refs(*command, ls_refs_request([prefix]))
+            return self._cache_ls_remote(key, parse_ls_refs(output))
+        except (OSError, ValueError, subprocess.SubprocessError):
+            return self._ls_remote(repo_url, tags=True)
+
+    async def _release_tags_async(self, repo_url, releases=None):
+        """_release_tags on the async engine"""
+        prefix = tag_prefix((releases or {}).get('pattern'))
+        command = ls_refs_command(repo_url) if prefix != 'refs/tags/' else None
+        if command is None:
+            return await self._ls_remote_async(repo_url, tags=True)
+
+        key = (repo_url, ('ls-refs', prefix), ())
+        cached = self._cached_ls_remote(key)
+        if cached is not None:
+            return cached
+        args, handshake = command
+        try:
+            output = await self.runner.run(args, host=url_host(repo_url), env=self._ls_refs_env(),
+                                           input=ls_refs_request([prefix]), handshake=handshake)
+            return self._cache_ls_remote(key, parse_ls_refs(output))
+        except (OSError, ValueError, subprocess.SubprocessError):
+            return await self._ls_remote_async(repo_url, tags=True)
+
+    def _run_ls_refs(self, args, handshake, request):
+        """Send an ls-refs request to upload-pack and return the raw reply"""
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=self._ls_refs_env())
+        # The handshake read has no timeout of its own, so a timer bounds the whole exchange
+        timer = threading.Timer(self.runner.timeout, process.kill) if self.runner.timeout else None
+        try:
+            if timer:
+                timer.start()
+            if handshake:
+                process.stdin.write(handshake)
+                process.stdin.flush()
+                if process.stdout.readline() != b'\n':
+                    raise subprocess.CalledProcessError(1, args, '', 'handshake refused')
+            stdout, stderr = process.communicate(request)
+        finally:
+            if timer:
+                timer.cancel()
+            if process.returncode is None:
+                process.kill()
+                process.wait()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+        return stdout
+
+    def _ls_refs_env(self):
+        """Environment asking upload-pack for protocol v2"""
+        return dict(self._async_git_env(), GIT_PROTOCOL='version=2')
+
+    def _release_key(self, releases):
+        """Ref cache key of a latest-release query"""
+        return 'latest-release ' + json.dumps(releases or {}, sort_keys=True)
+
+    def _store_release(self, repo_url, releases, refs):
+        """Pick the latest release from listed tag refs and cache it"""
+        releases = releases or {}
+        tags = {ref[len('refs/tags/'):]: sha for ref, sha in refs.items()
+                if ref.startswith('refs/tags/')}
+        tag = latest_version(tags, releases.get('pattern'), releases.get('prereleases', False))
+        self.ref_cache.put(repo_url, self._release_key(releases), [tag, tags.get(tag)])
+        if tag:
+            self.ref_cache.put(repo_url, f'refs/tags/{tag}', tags[tag])
+        return tag, tags.get(tag)
+
+    def _resolve_ref(self, repo_url, ref):
+        """Commit SHA of a full ref name on the remote, or None if it doesn't exist
+
+        A fresh cached answer is used as is; otherwise only this one ref is
+        listed, which is much cheaper than fetching to find out.
+        """
+        sha = self.ref_cache.get(repo_url, ref)
+        if sha is None:
+            sha = self._ls_remote(repo_url, ref).get(ref)
+            if sha:
+                self.ref_cache.put(repo_url, ref, sha)
+        return sha
+
+    async def _resolve_ref_async(self, repo_url, ref):
+        """_resolve_ref on the async engine"""
+        sha = self.ref_cache.get(repo_url, ref)
+        if sha is None:
+            sha = (await self._ls_remote_async(repo_url, ref)).get(ref)
+            if sha:
+                self.ref_cache.put(repo_url, ref, sha)
+        return sha
+
+    def resolve_latest_tags(self, repo_urls, parallel=16, releases=None):
+        """Resolve the latest release tag of many remotes concurrently
+
+        Returns a dict of URL to tag (None when a remote has no tags or
+        could not be reached).
+        """
+        async def resolve(repo_url):
+            try:
+                return (await self._latest_release_async(repo_url, releases))[0]
+            except subprocess.SubprocessError as e:
+                print(f"⚠️ Could not list tags of {repo_url}: {str(e)}")
+                return None
+
+        urls = list(dict.fromkeys(repo_urls))
+        results = self.runner.gather([resolve(url) for url in urls], parallel)
+        return {url: None if isinstance(result, Exception) else result
+                for url, result in zip(urls, results)}
 
-    def _checkout_version(self, repo, source_spec):
+    def _checkout_version(self, repo, source_spec, releases=None):
         """Checkout specific version based on source specification"""
+        # Detached, because a branch can only be checked out in one worktree
         if source_spec == 'main':
-            repo.git.checkout('main')
+            repo.git.checkout('--detach', 'main')
         elif source_spec == 'latest-release':
-            tags = sorted(repo.tags, key=lambda t: LooseVersion(t.name), reverse=True)
-            if tags:
-                repo.git.checkout(tags[0])
+            releases = releases or {}
+            tag = latest_version((t.name for t in repo.tags), releases.get('pattern'),
+                                 releases.get('prereleases', False))
+            if tag:
+                repo.git.checkout(tag)
             else:
                 print("⚠️ No releases found, using main branch")
         else:  # specific version
-            repo.git.checkout(source_spec)
-
-    def _build_package(self, install_path):
-        """Attempt to build and install the package"""
-        try:
-            if os.path.exists(os.path.join(install_path, 'Makefile')):
-                subprocess.run(['make', '-C', install_path], check=True)
-                subprocess.run(
-                    ['sudo', 'make', '-C', install_path, 'install'], 
-                    check=True
-                )
-            elif os.path.exists(os.path.join(install_path, 'setup.py')):
-                subprocess.run(
-                    ['sudo', 'python3', '-m', 'pip', 'install', install_path],
-                    check=True
-                )
+            repo.git.checkout('--detach', source_spec)
+
+    def _store_object(self, blob_sha, mode):
+        """Path of a file's content in the content-addressed store"""
+        suffix = '.x' if mode == '100755' else ''
+        return os.path.join(self.store_dir, blob_sha[:2], blob_sha[2:] + suffix)
+
+    def _reflink(self, src, dst):
+        """Create dst as a copy-on-write clone of src"""
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        os.chmod(dst, os.stat(src).st_mode & 0o777)
+
+    def _supports_reflinks(self):
+        """Whether the store's filesystem can clone files copy-on-write"""
+        if self._reflinks is None:
+            probe = os.path.join(self.store_dir, f".reflink-probe-{os.getpid()}")
+            with open(probe, 'w') as f:
+                f.write('probe')
+            try:
+                self._reflink(probe, f"{probe}.copy")
+                self._reflinks = True
+            except OSError:
+                self._reflinks = False
+            finally:
+                for path in (probe, f"{probe}.copy"):
+                    if os.path.exists(path):
+                        os.unlink(path)
+        return self._reflinks
+
+    def _link_tree_to_store(self, install_path, manual=False):
+        """Share a checkout's tracked files with the content-addressed store
+
+        Files whose blob is already stored are replaced by a reflink, or a
+        hardlink where reflinks are unsupported; new blobs are added to the
+        store. Identical files across packages, versions and reinstalls then
+        occupy disk space once.
+
+        Reflinked files get the current time, as a stored copy can be older
+        than the build outputs a reused build tree already holds. Hardlinks
+        are only used for trees that are not built (``manual``), because a
+        build step that rewrites a tracked file in place would change it in
+        every tree sharing the inode.
+        """
+        if not self.use_store:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        reflink = self._supports_reflinks()
+        if not reflink and not manual:
+            return
+        from git import Git
+        git = Git(install_path)
+        for entry in git.ls_files('-s', '-z').split('\0'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            mode, blob_sha, _ = info.split()
+            if mode not in ('100644', '100755'):
+                continue  # symlinks and submodules
+            path = os.path.join(install_path, path)
+            obj = self._store_object(blob_sha, mode)
+            try:
+                if not os.path.exists(obj):
+                    os.makedirs(os.path.dirname(obj), exist_ok=True)
+                    tmp_obj = f"{obj}.tmp-{os.getpid()}-{threading.get_ident()}"
+                    if reflink:
+                        self._reflink(path, tmp_obj)
+                    else:
+                        os.link(path, tmp_obj)
+                    os.replace(tmp_obj, obj)
+                elif reflink:
+                    tmp_path = f"{path}.gitstaller-tmp"
+                    self._reflink(obj, tmp_path)
+                    os.utime(tmp_path)
+                    os.replace(tmp_path, path)
+                elif not os.path.samefile(obj, path):
+                    if os.path.getsize(obj) != os.path.getsize(path):
+                        # The stored copy was edited through another hardlink;
+                        # store the freshly checked out file in its place
+                        tmp_obj = f"{obj}.tmp-{os.getpid()}-{threading.get_ident()}"
+                        os.link(path, tmp_obj)
+                        os.replace(tmp_obj, obj)
+                        continue
+                    tmp_path = f"{path}.gitstaller-tmp"
+                    os.link(obj, tmp_path)
+                    os.replace(tmp_path, path)
+            except OSError:
+                continue  # e.g. the store is on another filesystem; keep the copy
+        # Linking changed inodes; refresh the index so git doesn't rehash later
+        git.update_index('-q', '--refresh', with_exceptions=False)
+
+    def _gc_store(self):
+        """Delete stored files that no checkout links to any more
+
+        Hardlinked objects are unused once the store holds their only link.
+        Reflinked copies share no inode with the store, so there the blobs
+        tracked by the remaining checkouts are listed instead. An object
+        deleted while another process links to it only costs that checkout
+        its sharing; its own copy stays intact.
+        """
+        self._store_garbage = False
+        if not os.path.isdir(self.store_dir):
+            return
+        referenced = self._referenced_objects() if self._supports_reflinks() else None
+        for root, _, files in os.walk(self.store_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if '.tmp-' in name or name.startswith('.reflink-probe-'):
+                    continue  # being added by another process
+                try:
+                    if (path not in referenced if referenced is not None
+                            else os.stat(path).st_nlink == 1):
+                        os.unlink(path)
+                except OSError:
+                    pass
+
+    def _referenced_objects(self):
+        """Store paths of the files tracked by every installed version"""
+        from git import Git
+        referenced = set()
+        if not os.path.isdir(self.package_dir):
+            return referenced
+        for package in os.scandir(self.package_dir):
+            for version_path in self._versions(package.name):
+                listing = Git(version_path).ls_files('-s', '-z', with_exceptions=False)
+                for entry in listing.split('\0'):
+                    if not entry:
+                        continue
+                    mode, blob_sha, _ = entry.split('\t', 1)[0].split()
+                    if mode in ('100644', '100755'):
+                        referenced.add(self._store_object(blob_sha, mode))
+        return referenced
+
+    def _build_fingerprint(self, install_path, subdir=None):
+        """Hash of the build inputs: source tree, build system and build environment"""
+        from git import Git
+        digest = hashlib.sha256()
+        digest.update(Git(install_path).rev_parse('HEAD^{tree}').encode())
+        build_path = os.path.join(install_path, subdir or '')
+        if subdir:
+            digest.update(f"subdir:{subdir}".encode())
+        for build_file in ('Makefile', 'setup.py'):
+            digest.update(f"{build_file}:{os.path.exists(os.path.join(build_path, build_file))}".encode())
+        for var in BUILD_ENV_VARS:
+            digest.update(f"{var}={os.environ.get(var, '')}".encode())
+        return digest.hexdigest()
+
+    def _toolchain_fingerprint(self):
+        """Compiler, architecture and libc identity that prebuilt artifacts depend on"""
+        if self._toolchain is None:
+            import platform
+            compiler = os.environ.get('CC', 'cc')
+            try:
+                version = subprocess.run([compiler, '--version'], capture_output=True,
+                                         text=True).stdout.split('\n')[0]
+            except OSError:
+                version = 'none'
+            self._toolchain = '|'.join((sys.platform, platform.machine(),
+                                        '-'.join(platform.libc_ver()), compiler, version))
+        return self._toolchain
+
+    def _artifact_path(self, repo_url, install_path, subdir=None):
+        """Cache path of the prebuilt artifact for this URL, commit, build and toolchain"""
+        from git import Git
+        key = '\n'.join((repo_url, Git(install_path).rev_parse('HEAD'),
+                         'make && make install DESTDIR',
+                         self._build_fingerprint(install_path, subdir),
+                         self._toolchain_fingerprint()))
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.artifact_dir, f"{self._extract_name(repo_url)}-{digest[:24]}.tar.gz")
+
+    def _python_fingerprint(self):
+        """Identity of the python3 that builds and installs wheels"""
+        if self._python is None:
+            try:
+                self._python = subprocess.run(
+                    ['python3', '-c', 'import sys, sysconfig; '
+                     'print(sys.implementation.cache_tag, sysconfig.get_platform())'],
+                    capture_output=True, text=True).stdout.strip()
+            except OSError:
+                self._python = 'none'
+        return self._python
+
+    def _wheelhouse_path(self, repo_url, install_path, subdir=None):
+        """Wheelhouse directory of this URL's commit, build inputs and python3"""
+        from git import Git
+        sha = Git(install_path).rev_parse('HEAD')
+        key = '\n'.join((repo_url, self._build_fingerprint(install_path, subdir),
+                         self._python_fingerprint()))
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.wheel_dir, f"{self._extract_name(repo_url)}-{sha}-{digest[:12]}")
+
+    def _build_wheels(self, build_path, wheelhouse):
+        """Build the package's wheel into wheelhouse, which appears atomically"""
+        os.makedirs(self.wheel_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.building-', dir=self.wheel_dir)
+        try:
+            subprocess.run(['python3', '-m', 'pip', 'wheel', '--no-deps',
+                            '--wheel-dir', staging, build_path], check=True)
+            os.chmod(staging, 0o755)  # mkdtemp's 0700 would hide a shared wheelhouse
+            try:
+                os.rename(staging, wheelhouse)
+            except OSError:
+                # Another process built the same commit first
+                if not os.path.isdir(wheelhouse):
+                    raise
+        finally:
+            rmtree(staging, ignore_errors=True)
+
+    def _install_artifact(self, artifact):
+        """Unpack a prebuilt artifact over the filesystem root"""
+        subprocess.run(['sudo', 'tar', '-xzf', artifact, '-C', '/', '--no-overwrite-dir'],
+                       check=True)
+
+    def _make_install(self, install_path, artifact=None):
+        """Run make install, packing its output into artifact when DESTDIR is honored"""
+        if artifact:
+            with tempfile.TemporaryDirectory(prefix='gitstaller-stage-') as staging:
+                staged = subprocess.run(
+                    ['make', '-C', install_path, 'install', f'DESTDIR={staging}']
+                ).returncode == 0 and any(os.scandir(staging))
+                if staged:
+                    os.makedirs(self.artifact_dir, exist_ok=True)
+                    tmp_artifact = f"{artifact}.tmp-{os.getpid()}-{threading.get_ident()}"
+                    subprocess.run(['tar', '-czf', tmp_artifact, '--owner=0', '--group=0',
+                                    '-C', staging, '.'], check=True)
+                    os.replace(tmp_artifact, artifact)
+                    self._install_artifact(artifact)
+                    return
+            # The Makefile ignores DESTDIR, so there is nothing to cache
+        subprocess.run(
+            ['sudo', 'make', '-C', install_path, 'install'], 
+            check=True
+        )
+
+    def _build_package(self, install_path, jobs=None, repo_url=None, subdir=None):
+        """Attempt to build and install the package
+
+        Makefile builds are cached as artifacts keyed by URL, commit, build
+        inputs and toolchain; on a cache hit the artifact is unpacked
+        instead of running make. setup.py packages are built into a
+        wheelhouse keyed by commit and installed from the wheel, so a
+        cached wheel skips compilation. Monorepo packages build in ``subdir``.
+        """
+        package_name = os.path.basename(os.path.dirname(install_path))
+        phase = lambda name: self.timer.phase(package_name, name)
+        build_path = os.path.join(install_path, subdir or '')
+        try:
+            if os.path.exists(os.path.join(build_path, 'Makefile')):
+                artifact = None
+                if self.use_artifacts and repo_url:
+                    artifact = self._artifact_path(repo_url, install_path, subdir)
+                    if os.path.exists(artifact):
+                        print(f"📦 Using prebuilt artifact {os.path.basename(artifact)}")
+                        with phase('artifact'):
+                            self._install_artifact(artifact)
+                        print("Build and system installation completed successfully")
+                        return True
+                with phase('job wait'):
+                    jobs = self.job_budget.acquire(jobs or self.jobs or self.job_budget.total)
+                try:
+                    with phase('make'):
+                        subprocess.run(['make', '-C', build_path, f'-j{jobs}'], check=True)
+                finally:
+                    self.job_budget.release(jobs)
+                with phase('make install'):
+                    self._make_install(build_path, artifact)
+            elif os.path.exists(os.path.join(build_path, 'setup.py')):
+                target = build_path
+                if self.use_artifacts and repo_url:
+                    wheelhouse = self._wheelhouse_path(repo_url, install_path, subdir)
+                    if os.path.isdir(wheelhouse):
+                        print(f"📦 Using cached wheel {os.path.basename(wheelhouse)}")
+                    else:
+                        try:
+                            with phase('pip wheel'):
+                                self._build_wheels(build_path, wheelhouse)
+                        except subprocess.CalledProcessError as e:
+                            print(f"⚠️ Could not build a wheel, installing from source: {str(e)}")
+                    if os.path.isdir(wheelhouse):
+                        wheels = sorted(entry.path for entry in os.scandir(wheelhouse)
+                                        if entry.name.endswith('.whl'))
+                        target = wheels[0] if wheels else build_path
+                with phase('pip install'):
+                    subprocess.run(
+                        ['sudo', 'python3', '-m', 'pip', 'install', target],
+                        check=True
+                    )
+                    if target != build_path:
+                        # pip skips a wheel whose name and version are already installed,
+                        # which new commits rarely change; the first call only brings in
+                        # missing dependencies then
+                        subprocess.run(['sudo', 'python3', '-m', 'pip', 'install',
+                                        '--force-reinstall', '--no-deps', target], check=True)
             print("Build and system installation completed successfully")
+            return True
         except subprocess.CalledProcessError as e:
             print(f"Build failed: {str(e)}")
+            return False
 
-    def install(self, repo_url, source='main', manual=False, reinstall=False):
+    def install(self, repo_url, source='main', manual=False, reinstall=False,
+                clone=None, depends=None, releases=None):
         """Install package from Git repository"""
-        package_name = self._extract_name(repo_url)
-        install_path = os.path.join(self.package_dir, package_name)
+        status = self._clone_package(repo_url, source, reinstall, clone, releases, manual)
+        if status != 'cloned':
+            return status
+        return self._complete_install(repo_url, source, manual, clone, depends=depends,
+                                      releases=releases)
 
-        if os.path.exists(install_path) and not reinstall:
-            print(f"⚠️ Package {package_name} is already installed")
+    def install_many(self, repo_urls, source='main', manual=False,
+                     parallel=4, max_builds=2, clone=None, depends=None, releases=None):
+        """Install several packages, overlapping clones with builds
+
+        Clones run on a pool of ``parallel`` workers; each finished clone is
+        handed to a separate pool of ``max_builds`` workers for the build
+        step, so network waits overlap with compilation.
+        """
+        specs = [{"url": repo_url, "source": source, "manual": manual,
+                  "clone": clone, "depends": depends, "releases": releases}
+                 for repo_url in repo_urls]
+        with self._batched_metadata():
+            results = self._install_specs(specs, parallel, max_builds)
+        self._print_results(results)
+        return {name: status for name, (status, _) in results.items()}
+
+    def _install_specs(self, specs, parallel=4, max_builds=2):
+        """Install packages described by dicts of install() arguments
+
+        Returns a dict of package name to (status, seconds).
+        """
+        # Split the job budget between concurrent builds unless -j was given
+        jobs = self.jobs or max(1, self.job_budget.total // max(1, max_builds))
+        packages = {}
+        for spec in specs:
+            packages.setdefault(self._extract_name(spec['url']), spec)
+
+        results = {}
+        started = {name: time.monotonic() for name in packages}
+        with ThreadPoolExecutor(max_workers=max(1, max_builds)) as build_pool:
+            builds = {}
+            with ThreadPoolExecutor(max_workers=max(1, parallel)) as clone_pool:
+                clones = {
+                    clone_pool.submit(self._clone_package, spec['url'], spec.get('source', 'main'),
+                                      spec.get('reinstall', False), spec.get('clone'),
+                                      spec.get('releases'), spec.get('manual', False)): name
+                    for name, spec in packages.items()
+                }
+                for future in as_completed(clones):
+                    name = clones[future]
+                    spec = packages[name]
+                    status = self._result_of(future)
+                    if status == 'cloned':
+                        future = build_pool.submit(
+                            self._complete_install, spec['url'], spec.get('source', 'main'),
+                            spec.get('manual', False), spec.get('clone'), jobs,
+                            spec.get('depends'), spec.get('releases'))
+                        builds[future] = name
+                    else:
+                        results[name] = (status, time.monotonic() - started[name])
+            for future in as_completed(builds):
+                name = builds[future]
+                results[name] = (self._result_of(future), time.monotonic() - started[name])
+        return results
+
+    def _result_of(self, future):
+        """Return a worker's status, reporting unexpected errors as failures"""
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+            return 'failed'
+
+    def _print_results(self, results):
+        """Print a per-package summary of a bulk operation"""
+        icons = {'installed': '✅', 'updated': '✅', 'unchanged': '✔️',
+                 'skipped': '⚠️', 'build failed': '⚠️', 'failed': '❌'}
+        print("\nSummary:")
+        for name in sorted(results):
+            status, elapsed = results[name]
+            print(f"  {icons.get(status, '•')} {name}: {status} ({elapsed:.1f}s)")
+
+    def _package_path(self, package_name):
+        """Checkout of the package's current version, or None if it isn't installed"""
+        package_root = os.path.join(self.package_dir, package_name)
+        self._migrate_layout(package_root)
+        current = os.path.join(package_root, 'current')
+        return os.path.realpath(current) if os.path.isdir(current) else None
+
+    def _migrate_layout(self, package_root):
+        """Move a pre-versioning checkout at packages/<name> into packages/<name>/<sha>"""
+        if not os.path.isdir(os.path.join(package_root, '.git')):
             return
+        from git import Git
+        version = Git(package_root).rev_parse('--short=12', 'HEAD')
+        moved = f"{package_root}.migrating-{os.getpid()}"
+        os.rename(package_root, moved)
+        os.makedirs(package_root)
+        os.rename(moved, os.path.join(package_root, version))
+        self._set_current(package_root, os.path.join(package_root, version))
+
+    def _version_dir(self, package_root, version):
+        """Directory holding one installed version (a tag name or short commit SHA)"""
+        return os.path.join(package_root, version.replace('/', '_'))
+
+    def _versions(self, package_name):
+        """Installed version directories of a package, newest first"""
+        package_root = os.path.join(self.package_dir, package_name)
+        if not os.path.isdir(package_root):
+            return []
+        versions = [entry for entry in os.scandir(package_root)
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.')]
+        versions.sort(key=lambda entry: entry.stat(follow_symlinks=False).st_mtime, reverse=True)
+        return [entry.path for entry in versions]
 
+    def _set_current(self, package_root, version_path):
+        """Atomically point packages/<name>/current at version_path"""
+        tmp_link = os.path.join(package_root, f".current-{os.getpid()}-{threading.get_ident()}")
+        os.symlink(os.path.basename(version_path), tmp_link)
+        os.replace(tmp_link, os.path.join(package_root, 'current'))
+        os.utime(version_path, follow_symlinks=False)
+
+    def _prune_versions(self, package_name, keep=KEEP_VERSIONS):
+        """Delete all but the newest ``keep`` versions, never the current one
+
+        Returns whether any version was deleted, which leaves store objects
+        for _gc_store to collect.
+        """
+        current = self._package_path(package_name)
+        pruned = False
+        for version_path in self._versions(package_name)[keep:]:
+            if version_path != current:
+                self._remove_version(version_path)
+                pruned = True
+        return pruned
+
+    def _remove_version(self, version_path):
+        """Delete a version directory and unregister it if it is a worktree"""
+        rmtree(version_path, ignore_errors=True)
+        shared_path = self._shared_repo_path(os.path.dirname(version_path))
+        if os.path.isdir(shared_path):
+            from git import Git
+            Git(shared_path).worktree('prune')
+
+    def _shared_repo_path(self, package_root):
+        """Bare repository whose objects all versions of a package share"""
+        return os.path.join(package_root, '.repo.git')
+
+    def _ensure_shared_repo(self, repo_url, package_root, source, clone=None, ref=None,
+                            mirror_ref=None):
+        """Open the package's shared bare repository, cloning it on first use
+
+        Returns (repo, created). Every installed version is a ``git worktree``
+        of this repository, so extra versions only cost their working files.
+        ``mirror_ref`` names the one full ref the caller needs from the mirror.
+        """
+        from git import Repo
+        shared_path = self._shared_repo_path(package_root)
+        clone_url = (self._ensure_mirror(repo_url, mirror_ref)
+                     if self._clones_from_mirror(source, clone) else repo_url)
+        if os.path.isdir(shared_path):
+            repo = Repo(shared_path)
+            repo.remotes.origin.set_url(clone_url)
+            return repo, False
+
+        os.makedirs(package_root, exist_ok=True)
+        staging = f"{shared_path}.tmp-{os.getpid()}-{threading.get_ident()}"
         try:
-            if reinstall and os.path.exists(install_path):
-                rmtree(install_path)
+            options = dict(self._clone_options(source, clone), bare=True)
+            if source not in ('main', 'latest-release'):
+                repo = self._clone_pinned(clone_url, staging, source, options)
+            elif ref:
+                repo = Repo.clone_from(clone_url, staging, branch=ref, **options)
+            else:
+                repo = Repo.clone_from(clone_url, staging, **self._clone_options('main', clone),
+                                       bare=True)
+            # Keep branches current on fetch; worktrees are detached so this is safe
+            repo.git.config('remote.origin.fetch', '+refs/heads/*:refs/heads/*')
+            os.rename(staging, shared_path)
+        finally:
+            if os.path.exists(staging):
+                rmtree(staging, ignore_errors=True)
+        return Repo(shared_path), True
+
+    def _fetch_ref(self, shared, ref, clone=None):
+        """Fetch one branch (main by default), tag or commit into the shared repository"""
+        from git import GitCommandError
+        depth = (clone or {}).get('depth') or 1
+        depth_args = [f'--depth={depth}'] if self._is_shallow(shared) else []
+        branch = f'refs/heads/{ref or "main"}'
+        if ref is None or self._has_ref(shared, branch):
+            shared.git.fetch(*depth_args, 'origin', f'+{branch}:{branch}')
+            return
+        try:
+            shared.git.fetch(*depth_args, 'origin', 'tag', ref)
+        except GitCommandError:
+            shared.git.fetch(*depth_args, 'origin', ref)  # a commit SHA
+
+    def _tracked_branch(self, package_root, source):
+        """Full ref of the branch a source follows, or None for tag and commit pins"""
+        if source == 'main':
+            return 'refs/heads/main'
+        from git import Repo
+        shared_path = self._shared_repo_path(package_root)
+        if os.path.isdir(shared_path) and self._has_ref(Repo(shared_path), f'refs/heads/{source}'):
+            return f'refs/heads/{source}'
+        return None
+
+    def _has_ref(self, repo, ref):
+        """Whether the fully qualified ref exists in the repository"""
+        status, _, _ = repo.git.show_ref('--verify', '--quiet', ref,
+                                         with_extended_output=True, with_exceptions=False)
+        return status == 0
+
+    def _add_worktree(self, shared, version_path, commit, checkout=True, subdir=None):
+        """Add a detached worktree of the shared repository at version_path
+
+        With ``subdir`` the worktree is a cone-mode sparse checkout of that
+        directory (plus top-level files), so nothing else is written and,
+        in a partial clone, nothing else is downloaded.
+        """
+        from git import Git
+        if os.path.exists(version_path):
+            self._remove_version(version_path)
+        args = ['add', '--detach'] + ([] if checkout and not subdir else ['--no-checkout'])
+        shared.git.worktree(*args, version_path, commit)
+        if subdir:
+            # Written by hand: `git sparse-checkout` would switch the repository
+            # to per-worktree config and move core.bare where GitPython can't see it
+            shared.git.config('core.sparseCheckout', 'true')
+            shared.git.config('core.sparseCheckoutCone', 'true')
+            worktree = Git(version_path)
+            patterns = os.path.join(version_path, worktree.rev_parse('--git-path',
+                                                                     'info/sparse-checkout'))
+            os.makedirs(os.path.dirname(patterns), exist_ok=True)
+            with open(patterns, 'w') as f:
+                f.write(self._sparse_patterns(subdir))
+            if checkout:
+                worktree.checkout('-q', '--detach', commit)
+
+    def _sparse_patterns(self, subdir):
+        """Cone-mode sparse-checkout patterns selecting subdir and top-level files"""
+        lines = ['/*', '!/*/']
+        parts = subdir.strip('/').split('/')
+        for depth in range(1, len(parts) + 1):
+            prefix = '/' + '/'.join(parts[:depth]) + '/'
+            lines.append(prefix)
+            if depth < len(parts):
+                lines.append(f'!{prefix}*/')
+        return '\n'.join(lines) + '\n'
+
+    def _clone_options(self, source, clone=None):
+        """Build Repo.clone_from options from user clone settings
+
+        Releases and pinned versions only need a single ref, so unless a full
+        clone or a filter is requested they default to a depth-1 single-branch
+        clone. Sparse checkouts add a blob:none filter on top of that.
+        """
+        clone = clone or {}
+        if clone.get('full'):
+            return {}
+        depth = clone.get('depth')
+        single_branch = clone.get('single_branch', False)
+        if source != 'main' and depth is None and not clone.get('filter'):
+            depth, single_branch = 1, True
+        # A sparse checkout only needs the blobs below its subdirectory
+        clone_filter = clone.get('filter') or ('blob:none' if clone.get('subdir') else None)
 
+        options = {}
+        if depth:
+            options['depth'] = depth
+        if clone_filter:
+            options['filter'] = clone_filter
+        if single_branch:
+            options['single_branch'] = True
+        return options
+
+    def _clone_package(self, repo_url, source='main', reinstall=False, clone=None,
+                       releases=None, manual=False):
+        """Check out the requested source as a new version of the package
+
+        The version is a worktree at packages/<name>/<tag-or-sha> of the
+        package's shared bare repository, and is made the current version.
+        Installing another source of an installed package adds it alongside.
+        """
+        from git import Repo, GitCommandError
+        package_name = self._extract_name(repo_url)
+        package_root = os.path.join(self.package_dir, package_name)
+
+        installed = self._package_path(package_name)
+        entry = self._get_package(package_name) if installed else None
+        if installed and not reinstall and (
+                entry is None or entry.get('source', 'main') == source):
+            print(f"⚠️ Package {package_name} is already installed")
+            return 'skipped'
+
+        try:
             print(f"⏳ Installing {package_name}...")
-            
+
+            phase = lambda name: self.timer.phase(package_name, name)
             # Handle different source specifications
+            latest_tag = None
             if source == 'latest-release':
-                latest_tag = self._get_latest_tag(repo_url)
-                if latest_tag:
-                    Repo.clone_from(repo_url, install_path, branch=latest_tag)
+                with phase('resolve'):
+                    latest_tag = self._get_latest_tag(repo_url, releases)
+                if not latest_tag:
+                    print("⚠️ No releases found, using main branch")
+            ref = latest_tag or (None if source in ('main', 'latest-release') else source)
+            mirror_ref = (f'refs/tags/{latest_tag}' if latest_tag
+                          else 'refs/heads/main' if ref is None else None)
+            with phase('clone'):
+                shared, created = self._ensure_shared_repo(repo_url, package_root, source,
+                                                           clone, ref, mirror_ref)
+                if not created:
+                    self._fetch_ref(shared, ref, clone)
+
+            target = ref or 'main'
+            with phase('checkout'):
+                if ref and self._has_ref(shared, f'refs/tags/{ref}'):
+                    version = ref
                 else:
-                    Repo.clone_from(repo_url, install_path)
-            else:
-                repo = Repo.clone_from(repo_url, install_path)
-                self._checkout_version(repo, source)
+                    version = shared.git.rev_parse('--short=12', f'{target}^{{commit}}')
+                version_path = self._version_dir(package_root, version)
+                self._add_worktree(shared, version_path, f'{target}^{{commit}}', checkout=False,
+                                   subdir=(clone or {}).get('subdir'))
+                self._checkout_version(Repo(version_path), target)
+
+            self._set_current(package_root, version_path)
+            with phase('store'):
+                self._link_tree_to_store(version_path, manual)
+            if reinstall:
+                self._gc_store()
+            return 'cloned'
+        except (GitCommandError, PermissionError) as e:
+            print(f"❌ Installation error: {str(e)}")
+            return 'failed'
+
+    def _clone_pinned(self, repo_url, install_path, version, options):
+        """Clone for a pinned version, falling back to a blobless clone for commit SHAs"""
+        from git import Repo, GitCommandError
+        try:
+            return Repo.clone_from(repo_url, install_path, branch=version, **options)
+        except GitCommandError:
+            # --branch only accepts branch and tag names; commits need a fetch
+            if os.path.exists(install_path):
+                rmtree(install_path)
+        options = {key: value for key, value in options.items()
+                   if key not in ('depth', 'single_branch')}
+        options.setdefault('filter', 'blob:none')
+        options.setdefault('no_checkout', True)
+        return Repo.clone_from(repo_url, install_path, **options)
+
+    def _is_shallow(self, repo):
+        """Check whether a checkout was cloned with limited history"""
+        return os.path.exists(os.path.join(repo.git_dir, 'shallow'))
 
+    def _complete_install(self, repo_url, source='main', manual=False, clone=None,
+                          jobs=None, depends=None, releases=None):
+        """Build a cloned package and record it in metadata"""
+        from git import Repo
+        package_name = self._extract_name(repo_url)
+        install_path = self._package_path(package_name)
+        subdir = (clone or {}).get('subdir')
+        try:
             # Build unless manual flag is set
-            if not manual:
-                self._build_package(install_path)
-            
+            built = manual or self._build_package(install_path, jobs, repo_url, subdir)
+
             # Save metadata
-            self.metadata[package_name] = {
+            entry = {
                 "url": repo_url,
                 "source": source,
-                "manual": manual
+                "manual": manual,
+                "commit": Repo(install_path).head.commit.hexsha,
+                "version": os.path.basename(install_path),
+                "timings": self.timer.for_package(package_name)
             }
-            self._save_metadata()
-            
+            if clone:
+                entry["clone"] = clone
+            if depends:
+                entry["depends"] = depends
+            if releases:
+                entry["releases"] = releases
+            if built and not manual:
+                entry["build_hash"] = self._build_fingerprint(install_path, subdir)
+            self._set_package(package_name, entry)
+
             print(f"✅ {package_name} successfully installed")
-        except (GitCommandError, PermissionError) as e:
+            return 'installed' if built else 'build failed'
+        except PermissionError as e:
             print(f"❌ Installation error: {str(e)}")
+            return 'failed'
+
+    def update(self, package_name, manual=False, in_place=False):
+        """Update installed package
+
+        The build is skipped when neither the checked out commit nor the
+        build inputs changed since the last successful build; otherwise the
+        existing build tree is reused so make only rebuilds what changed.
+        """
+        status = self._fetch_update(package_name, manual, in_place)
+        if status != 'fetched':
+            return status
+        status = self._build_update(package_name, manual)
+        if self._store_garbage:
+            self._gc_store()
+        return status
 
-    def update(self, package_name, manual=False):
-        """Update installed package"""
-        if package_name not in self.metadata:
+    def _fetch_update(self, package_name, manual=False, in_place=False):
+        """Prepare a package's newest source as a new version; 'fetched' if it needs a build
+
+        Only the tracked ref is fetched into the package's shared repository.
+        When the source moved, a new worktree is added and seeded with a
+        copy of the current version's files, build tree included, then
+        advanced to the new commit, so make stays incremental and the
+        previous version stays intact for ``switch``.
+
+        With ``in_place`` the current worktree is instead reset to the new
+        commit, rewriting only the files that changed, and renamed to the
+        new version; the previous version is not kept.
+        """
+        from git import Repo, GitCommandError
+        entry = self._get_package(package_name)
+        if entry is None:
             print(f"❌ Package {package_name} not found")
-            return
+            return 'failed'
 
-        package_path = os.path.join(self.package_dir, package_name)
+        package_path = self._package_path(package_name)
+        if package_path is None:
+            print(f"❌ Package {package_name} has no checkout, reinstall it")
+            return 'failed'
         try:
             print(f"⏳ Updating {package_name}...")
-            repo = Repo(package_path)
-            source_spec = self.metadata[package_name].get('source', 'main')
-            
-            if source_spec == 'latest-release':
-                latest_tag = self._get_latest_tag(self.metadata[package_name]['url'])
-                if latest_tag:
-                    repo.git.fetch('--tags')
-                    repo.git.checkout(latest_tag)
-            else:
-                repo.remotes.origin.pull()
+            source_spec = entry.get('source', 'main')
+            package_root = os.path.dirname(package_path)
+            phase = lambda name: self.timer.phase(package_name, name)
+            skip_build = manual or entry.get('manual', False)
+            subdir = (entry.get('clone') or {}).get('subdir')
+            head = Repo(package_path).head.commit.hexsha
+
+            # Ask the remote (or the ref cache) first, so packages that did not
+            # move are done without fetching anything
+            latest_tag = None
+            with phase('resolve'):
+                if source_spec == 'latest-release':
+                    latest_tag, remote_sha = self._latest_release(entry['url'],
+                                                                  entry.get('releases'))
+                    tracked = latest_tag and f'refs/tags/{latest_tag}'
+                else:
+                    tracked = self._tracked_branch(package_root, source_spec)
+                    remote_sha = (self._resolve_ref(entry['url'], tracked) if tracked
+                                  else entry.get('commit'))
+            if remote_sha == head == entry.get('commit') and (
+                    skip_build or self._build_fingerprint(package_path, subdir) == entry.get('build_hash')):
+                print(f"✔️ {package_name} is already up to date")
+                return 'unchanged'
+
+            # Checkouts from before worktrees get a shared repository on first update
+            with phase('mirror'):
+                shared, _ = self._ensure_shared_repo(entry['url'], package_root, source_spec,
+                                                     entry.get('clone'), mirror_ref=tracked)
             
-            # Rebuild unless manual flag is set
-            if not manual and not self.metadata[package_name].get('manual', False'):
-                self._build_package(package_path)
+            target = version = None
+            if latest_tag:
+                with phase('fetch'):
+                    self._fetch_ref(shared, latest_tag, entry.get('clone'))
+                target, version = f'{latest_tag}^{{commit}}', latest_tag
+            elif tracked:
+                with phase('fetch'):
+                    self._fetch_ref(shared, tracked[len('refs/heads/'):], entry.get('clone'))
+                target = tracked
             
-            print(f"✅ {package_name} successfully updated")
-        except GitCommandError as e:
+            if target is None or shared.git.rev_parse(target) == head:
+                if head == entry.get('commit') and (
+                        skip_build or self._build_fingerprint(package_path, subdir) == entry.get('build_hash')):
+                    print(f"✔️ {package_name} is already up to date")
+                    return 'unchanged'
+                return 'fetched'
+
+            version = version or shared.git.rev_parse('--short=12', target)
+            version_path = self._version_dir(package_root, version)
+            # Only worktrees can be moved; older standalone checkouts get a new version
+            if in_place and os.path.isfile(os.path.join(package_path, '.git')):
+                with phase('checkout'):
+                    Repo(package_path).git.reset('-q', '--hard', target)
+                    if version_path != package_path:
+                        if os.path.exists(version_path):
+                            self._remove_version(version_path)
+                        shared.git.worktree('move', package_path, version_path)
+                        self._set_current(package_root, version_path)
+                with phase('store'):
+                    self._link_tree_to_store(version_path, skip_build)
+                self._pending_versions[package_name] = version_path
+                return 'fetched'
+            with phase('checkout'):
+                try:
+                    # Start from the current commit and files, then move only what changed
+                    self._add_worktree(shared, version_path, head, checkout=False, subdir=subdir)
+                    entries = [os.path.join(package_path, name)
+                               for name in os.listdir(package_path) if name != '.git']
+                    if entries:
+                        subprocess.run(['cp', '-a', '--reflink=auto', '-t', version_path]
+                                       + entries, check=True)
+                    new_repo = Repo(version_path)
+                    new_repo.git.reset('-q')
+                    new_repo.git.checkout('-q', '--detach', target)
+                except GitCommandError:
+                    # The current commit is not in the shared repository (e.g. shallow)
+                    self._add_worktree(shared, version_path, target, subdir=subdir)
+            with phase('store'):
+                self._link_tree_to_store(version_path, skip_build)
+            self._pending_versions[package_name] = version_path
+            return 'fetched'
+        except (GitCommandError, subprocess.CalledProcessError) as e:
             print(f"❌ Update error: {str(e)}")
+            return 'failed'
+
+    def _build_update(self, package_name, manual=False, jobs=None):
+        """Build a fetched version, make it current on success and record the result"""
+        from git import Repo
+        package_path = (self._pending_versions.pop(package_name, None)
+                        or self._package_path(package_name))
+        entry = dict(self._get_package(package_name))
+
+        # Rebuild unless manual flag is set
+        subdir = (entry.get('clone') or {}).get('subdir')
+        if not (manual or entry.get('manual', False)):
+            build_hash = self._build_fingerprint(package_path, subdir)
+            if not self._build_package(package_path, jobs, entry['url'], subdir):
+                if package_path == self._package_path(package_name):  # updated in place
+                    print(f"⚠️ {package_name} is checked out at "
+                          f"{os.path.basename(package_path)} but was not installed")
+                else:
+                    print(f"⚠️ {package_name} stays at version {entry.get('version')}")
+                return 'build failed'
+            entry['build_hash'] = build_hash
+        package_root = os.path.join(self.package_dir, package_name)
+        self._set_current(package_root, package_path)
+        if self._prune_versions(package_name):
+            self._store_garbage = True
+        entry['commit'] = Repo(package_path).head.commit.hexsha
+        entry['version'] = os.path.basename(package_path)
+        entry['timings'] = self.timer.for_package(package_name)
+        self._set_package(package_name, entry)
+
+        print(f"✅ {package_name} successfully updated")
+        return 'updated'
+
+    def switch(self, package_name, version=None, manual=False):
+        """Make another installed version current, or list versions when none is given
+
+        The version's existing build tree (or its cached artifact) is
+        installed again; nothing is cloned or rebuilt from scratch.
+        """
+        from git import Repo
+        entry = self._get_package(package_name)
+        if entry is None:
+            print(f"❌ Package {package_name} not found")
+            return 'failed'
+
+        current = self._package_path(package_name)
+        versions = self._versions(package_name)
+        if version is None:
+            for version_path in versions:
+                marker = '*' if version_path == current else ' '
+                print(f"{marker} {os.path.basename(version_path)}")
+            return 'unchanged'
+
+        package_root = os.path.join(self.package_dir, package_name)
+        version_path = self._version_dir(package_root, version)
+        if version_path not in versions:
+            print(f"❌ Version {version} of {package_name} is not installed")
+            return 'failed'
+        if version_path == current:
+            print(f"✔️ {package_name} is already at {version}")
+            return 'unchanged'
+
+        entry = dict(entry)
+        if not (manual or entry.get('manual', False)):
+            subdir = (entry.get('clone') or {}).get('subdir')
+            if not self._build_package(version_path, repo_url=entry['url'], subdir=subdir):
+                return 'build failed'
+            entry['build_hash'] = self._build_fingerprint(version_path, subdir)
+        self._set_current(package_root, version_path)
+        entry['commit'] = Repo(version_path).head.commit.hexsha
+        entry['version'] = os.path.basename(version_path)
+        self._set_package(package_name, entry)
+        print(f"✅ {package_name} switched to {version}")
+        return 'updated'
+
+    def update_all(self, manual=False, parallel=8, max_builds=2, in_place=False):
+        """Update every installed package
+
+        Remote refs are compared first so packages that did not move are
+        skipped without touching their checkout. The rest are fetched
+        concurrently and rebuilt on a bounded pool, each package only after
+        the packages listed in its ``depends`` metadata.
+        """
+        with self._batched_metadata():
+            results = self._update_packages(sorted(self.metadata), manual, parallel, max_builds,
+                                            in_place)
+        self._print_results(results)
+        return {name: status for name, (status, _) in results.items()}
+
+    def _update_packages(self, names, manual=False, parallel=8, max_builds=2, in_place=False):
+        """Update the named packages; returns a dict of name to (status, seconds)"""
+        started = {name: time.monotonic() for name in names}
+        results = {}
+        candidates = []
+        mirror_refs = {}
+        for name, (_, latest, state) in self._check_remotes(names, parallel).items():
+            entry = self.metadata[name]
+            needs_build = not (manual or entry.get('manual', False) or entry.get('build_hash'))
+            if state == 'outdated' or state == 'unknown' or needs_build:
+                candidates.append(name)
+                source = entry.get('source', 'main')
+                if self._clones_from_mirror(source, entry.get('clone')):
+                    if state == 'outdated':
+                        mirror_refs[entry['url']] = (
+                            f'refs/tags/{latest}' if source == 'latest-release'
+                            else f'refs/heads/{source}')
+                    else:
+                        mirror_refs.setdefault(entry['url'], None)
+            elif state == 'unreachable':
+                print(f"❌ Update error: {entry['url']} is unreachable")
+                results[name] = 'failed'
+            else:
+                results[name] = 'unchanged'
+
+        # Network fetches overlap on the async engine; the pool below then
+        # mostly moves objects from local mirrors into checkouts
+        if self.use_mirrors:
+            self._refresh_mirrors(mirror_refs, parallel)
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+            fetches = {pool.submit(self._fetch_update, name, manual, in_place): name
+                       for name in candidates}
+            fetched = []
+            for future in as_completed(fetches):
+                name = fetches[future]
+                status = self._result_of(future)
+                if status == 'fetched':
+                    fetched.append(name)
+                else:
+                    results[name] = status
+
+        jobs = self.jobs or max(1, self.job_budget.total // max(1, max_builds))
+        results.update(self._run_in_dependency_order(
+            fetched, lambda name: self._build_update(name, manual, jobs), max_builds))
+        # Pruned versions are collected from the store once for the whole batch
+        if self._store_garbage:
+            self._gc_store()
+        return {name: (status, time.monotonic() - started[name])
+                for name, status in results.items()}
+
+    def _run_in_dependency_order(self, names, task, max_workers):
+        """Run task(name) on a bounded pool, starting each name after its dependencies
+
+        Dependencies outside ``names`` are treated as satisfied. A package
+        whose dependency failed, or that is part of a cycle, is not run.
+        """
+        pending = set(names)
+        depends = {name: set(self.metadata[name].get('depends', [])) & pending for name in names}
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            running = {}
+            while pending or running:
+                ready = [name for name in sorted(pending) if depends[name] <= results.keys()]
+                while ready:
+                    for name in ready:
+                        pending.discard(name)
+                        if any(results[dep] not in ('updated', 'unchanged')
+                               for dep in depends[name]):
+                            print(f"⚠️ Skipping {name}: a dependency failed to update")
+                            results[name] = 'skipped'
+                        else:
+                            running[pool.submit(task, name)] = name
+                    # Skipped packages may in turn settle their dependents
+                    ready = [name for name in sorted(pending)
+                             if depends[name] <= results.keys()]
+                if not running:
+                    for name in pending:
+                        print(f"❌ Dependency cycle involving {name}")
+                        results[name] = 'failed'
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = self._result_of(future)
+        return results
 
     def reinstall(self, package_name, manual=False):
         """Reinstall existing package"""
-        if package_name not in self.metadata:
+        metadata = self._get_package(package_name)
+        if metadata is None:
             print(f"❌ Package {package_name} not found")
             return
             
-        metadata = self.metadata[package_name]
         self.install(
             metadata['url'],
             source=metadata.get('source', 'main'),
             manual=manual or metadata.get('manual', False),
-            reinstall=True
+            reinstall=True,
+            clone=metadata.get('clone'),
+            depends=metadata.get('depends'),
+            releases=metadata.get('releases')
         )
 
+    def remove(self, package_name):
+        """Remove a package's checkouts and metadata
+
+        System files are removed with ``make uninstall`` when the Makefile
+        provides that target; otherwise they are left in place.
+        """
+        entry = self._get_package(package_name)
+        if entry is None:
+            print(f"❌ Package {package_name} not found")
+            return 'failed'
+
+        current = self._package_path(package_name)
+        if current and not entry.get('manual', False):
+            current = os.path.join(current, (entry.get('clone') or {}).get('subdir') or '')
+            makefile = os.path.join(current, 'Makefile')
+            if os.path.exists(makefile):
+                with open(makefile, 'r', errors='replace') as f:
+                    has_uninstall = any(line.startswith('uninstall:') for line in f)
+                if has_uninstall:
+                    try:
+                        subprocess.run(['sudo', 'make', '-C', current, 'uninstall'], check=True)
+                    except subprocess.CalledProcessError as e:
+                        print(f"⚠️ Uninstall failed: {str(e)}")
+        rmtree(os.path.join(self.package_dir, package_name), ignore_errors=True)
+        self._gc_store()
+        self._set_package(package_name, None)
+        print(f"✅ {package_name} removed")
+        return 'removed'
+
+    def sync(self, manifest_path, lock_path=None, update_lock=False, prune=True,
+             parallel=4, max_builds=2):
+        """Converge installed packages on a gitstaller.toml manifest
+
+        Packages are installed, switched, updated or removed as needed, in
+        parallel. Commits recorded in the lockfile are installed exactly,
+        unless ``update_lock`` is set; the lockfile is then rewritten from
+        the resulting state. Changed clone options reclone a package, while
+        changed manual and depends settings are recorded in place.
+        """
+        lock_path = lock_path or os.path.splitext(manifest_path)[0] + '.lock'
+        desired = read_toml_manifest(manifest_path)
+        locked = {} if update_lock or not os.path.exists(lock_path) else read_lockfile(lock_path)
+
+        installs, updates, removals, reclones, settings = [], [], [], [], []
+        for name, spec in desired.items():
+            entry = self.metadata.get(name)
+            lock = locked.get(name, {})
+            pinned = lock.get('commit') if (lock.get('url'), lock.get('source')) == (
+                spec['url'], spec['source']) else None
+            if entry is None or entry.get('url') != spec['url']:
+                installs.append(dict(spec, source=pinned or spec['source'],
+                                     reinstall=entry is not None))
+                continue
+            if (entry.get('manual', False), entry.get('depends') or None) != (
+                    spec['manual'], spec['depends']):
+                settings.append(name)
+            if (entry.get('clone') or None) != spec['clone']:
+                # Depth, filter and subdir shape the shared repository, so start afresh
+                reclones.append(name)
+                installs.append(dict(spec, source=pinned or spec['source'], reinstall=True))
+            elif pinned and entry.get('commit') != pinned:
+                installs.append(dict(spec, source=pinned))
+            elif not pinned and entry.get('source', 'main') != spec['source']:
+                installs.append(dict(spec))
+            elif entry.get('releases') != spec['releases'] and spec['source'] == 'latest-release':
+                installs.append(dict(spec, reinstall=True))
+            elif not pinned:
+                updates.append(name)
+        if prune:
+            removals = [name for name in self.metadata if name not in desired]
+
+        with self._batched_metadata():
+            # Reinstalls record the new settings themselves; update the rest in place
+            reinstalled = {self._extract_name(spec['url']) for spec in installs}
+            for name in settings:
+                if name in reinstalled:
+                    continue
+                entry = dict(self.metadata[name], manual=desired[name]['manual'])
+                entry.pop('depends', None)
+                if desired[name]['depends']:
+                    entry['depends'] = desired[name]['depends']
+                self._set_package(name, entry)
+                if not entry['manual'] and not entry.get('build_hash') and name not in updates:
+                    updates.append(name)  # no longer manual and never built
+            for name in reclones:
+                rmtree(os.path.join(self.package_dir, name), ignore_errors=True)
+
+            results = {}
+            for name in removals:
+                started = time.monotonic()
+                results[name] = (self.remove(name), time.monotonic() - started)
+            results.update(self._install_specs(installs, parallel, max_builds))
+            results.update(self._update_packages(updates, parallel=parallel, max_builds=max_builds))
+        for name in desired:
+            results.setdefault(name, ('unchanged', 0.0))
+
+        write_lockfile(lock_path, {
+            name: {"url": spec['url'], "source": spec['source'],
+                   "commit": self.metadata[name].get('commit')}
+            for name, spec in desired.items() if name in self.metadata
+        })
+        self._print_results(results)
+        return {name: status for name, (status, _) in results.items()}
+
+    def outdated(self, parallel=32):
+        """Compare installed commits with remote refs without fetching anything
+
+        Returns a dict of package name to (installed, latest, status).
+        """
+        results = self._check_remotes(sorted(self.metadata), parallel)
+        self._print_outdated(results)
+        return results
+
+    def _check_remotes(self, names, parallel=32):
+        """Compare installed commits of packages with their remote refs concurrently"""
+        async def check(package_name):
+            entry = self.metadata[package_name]
+            installed = entry.get('commit') or self._local_head(package_name)
+            source = entry.get('source', 'main')
+            # Versions that name a branch follow it, as update does; tags and SHAs are pinned
+            tracked = (None if source == 'latest-release' else
+                       self._tracked_branch(os.path.join(self.package_dir, package_name), source))
+            if source != 'latest-release' and tracked is None:
+                return installed, source, 'pinned'
+            try:
+                with self.timer.phase(package_name, 'resolve'):
+                    if source == 'latest-release':
+                        latest, remote_sha = await self._latest_release_async(
+                            entry['url'], entry.get('releases'))
+                        if latest is None:
+                            return installed, None, 'no releases'
+                    else:
+                        latest = remote_sha = await self._resolve_ref_async(entry['url'], tracked)
+            except subprocess.SubprocessError:
+                return installed, None, 'unreachable'
+            if remote_sha is None:
+                return installed, None, 'unknown'
+            return installed, latest, 'up to date' if remote_sha == installed else 'outdated'
+
+        results = self.runner.gather([check(name) for name in names], parallel)
+        return {name: result if not isinstance(result, Exception) else (None, None, 'unknown')
+                for name, result in zip(names, results)}
+
+    def _local_head(self, package_name):
+        """Commit checked out for a package, read from its local repository"""
+        from git import Git, GitCommandError
+        try:
+            return Git(self._package_path(package_name)).rev_parse('HEAD')
+        except (GitCommandError, OSError, TypeError):
+            return None
+
+    def _print_outdated(self, results):
+        """Print the outdated report as a table"""
+        if not results:
+            print("No packages installed")
+            return
+
+        def short(ref):
+            return ref[:12] if ref and len(ref) == 40 else (ref or '-')
+
+        rows = [('Package', 'Installed', 'Latest', 'Status')]
+        rows += [(name, short(installed), short(latest), status)
+                 for name, (installed, latest, status) in sorted(results.items())]
+        widths = [max(len(row[i]) for row in rows) for i in range(3)]
+        for row in rows:
+            print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)) + '  ' + row[3])
+
     def _extract_name(self, repo_url):
         """Extract package name from repository URL"""
         return repo_url.split('/')[-1].replace('.git', '')
 
+def read_manifest(path):
+    """Read repository URLs from a manifest file (one per line, # comments)"""
+    with open(path, 'r') as f:
+        lines = (line.split('#', 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+def read_toml_manifest(path):
+    """Read package specs from a gitstaller.toml manifest, keyed by package name
+
+    Each ``[packages.<name>]`` table has a ``url`` and optionally
+    ``source``, ``manual``, ``depends``, a ``clone`` table of clone
+    options and a ``releases`` table (``pattern``, ``prereleases``).
+    """
+    packages = {}
+    for name, table in _load_toml(path).get('packages', {}).items():
+        if 'url' not in table:
+            raise ValueError(f"package {name} in {path} has no url")
+        package_name = table['url'].split('/')[-1].replace('.git', '')
+        if package_name != name:
+            raise ValueError(f"package {name} in {path} is named {package_name} by its url")
+        packages[name] = {
+            "url": table['url'],
+            "source": table.get('source', 'main'),
+            "manual": table.get('manual', False),
+            "clone": table.get('clone') or None,
+            "depends": table.get('depends') or None,
+            "releases": table.get('releases') or None,
+        }
+    return packages
+
+def read_lockfile(path):
+    """Read pinned package commits from a lockfile written by write_lockfile"""
+    return _load_toml(path).get('packages', {})
+
+def _load_toml(path):
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ValueError(f"reading {path} needs Python 3.11+ or the tomli package")
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+def write_lockfile(path, packages):
+    """Write pinned package commits as TOML, atomically"""
+    lines = ["# Generated by gitstaller sync. Do not edit.", ""]
+    for name in sorted(packages):
+        lines.append(f"[packages.{json.dumps(name)}]")
+        for key, value in packages[name].items():
+            if value is not None:
+                lines.append(f"{key} = {json.dumps(value)}")
+        lines.append("")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.gitstaller-lock-')
+    with os.fdopen(fd, 'w') as f:
+        os.fchmod(fd, 0o644)
+        f.write('\n'.join(lines))
+    os.replace(tmp_path, path)
+
 def main():
     parser = argparse.ArgumentParser(description='Gitstaller - Git-based package manager')
+    parser.add_argument('--no-mirror', action='store_true',
+                        help='Clone and fetch directly instead of through the local mirror cache')
+    parser.add_argument('--metadata-backend', choices=['json', 'sqlite'],
+                        default=os.environ.get('GITSTALLER_METADATA_BACKEND', 'json'),
+                        help='Where installed package metadata is stored')
+    parser.add_argument('--artifact-cache', default=os.environ.get('GITSTALLER_ARTIFACT_CACHE'),
+                        help='Directory of prebuilt artifacts, may be shared between hosts')
+    parser.add_argument('--wheelhouse', default=os.environ.get('GITSTALLER_WHEELHOUSE'),
+                        help='Directory of wheels built from setup.py packages, may be shared '
+                             'between hosts')
+    parser.add_argument('--no-artifacts', action='store_true',
+                        help='Always build from source and do not cache build output')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Do not share checked out files through the content-addressed store')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Check remotes again instead of trusting recently resolved refs')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='Give up on a remote that takes longer than this to answer')
+    parser.add_argument('--per-host', type=int, default=PER_HOST_LIMIT,
+                        help='Concurrent connections to one remote host')
+    parser.add_argument('--timings', metavar='FILE',
+                        help='Write per-package phase timings as JSON lines')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write phase timings as a Chrome trace (chrome://tracing, Perfetto)')
     subparsers = parser.add_subparsers(dest='command')
 
     # Install command
     install_parser = subparsers.add_parser('install', help='Install a package')
-    install_parser.add_argument('repo_url', help='Git repository URL')
+    install_parser.add_argument('repo_urls', nargs='*', metavar='repo_url',
+                              help='Git repository URL(s)')
+    install_parser.add_argument('--manifest',
+                              help='File with one repository URL per line')
+    install_parser.add_argument('-p', '--parallel', type=int, default=4,
+                              help='Number of concurrent clones')
+    install_parser.add_argument('--max-builds', type=int, default=2,
+                              help='Number of concurrent builds')
     install_parser.add_argument('-m', '--manual', action='store_true', 
                               help='Skip automatic build')
+    install_parser.add_argument('-j', '--jobs', type=int,
+                              help='Parallel make jobs (default: available CPUs)')
     install_parser.add_argument('--source', choices=['main', 'latest-release', 'version'],
                               default='main', help='Installation source')
     install_parser.add_argument('--version', help='Specific version to install')
+    install_parser.add_argument('--depth', type=int,
+                              help='Clone only the last N commits')
+    install_parser.add_argument('--filter', dest='clone_filter',
+                              help="Partial clone filter, e.g. 'blob:none'")
+    install_parser.add_argument('--single-branch', action='store_true',
+                              help='Clone only the requested branch or tag')
+    install_parser.add_argument('--full-clone', action='store_true',
+                              help='Clone full history even for releases and versions')
+    install_parser.add_argument('--subdir', metavar='PATH',
+                              help='Only check out and build this directory of a monorepo '
+                                   '(sparse checkout of a blob-less partial clone)')
+    install_parser.add_argument('--depends', action='append', metavar='PACKAGE',
+                              help='Installed package that must be rebuilt first on update --all')
+    install_parser.add_argument('--tag-pattern', metavar='GLOB',
+                              help="Only consider tags matching GLOB (e.g. 'v2.*') as releases")
+    install_parser.add_argument('--prereleases', action='store_true',
+                              help='Let alpha, beta, rc and dev tags count as the latest release')
 
     # Update command
     update_parser = subparsers.add_parser('update', help='Update a package')
-    update_parser.add_argument('package_name', help='Installed package name')
+    update_parser.add_argument('package_name', nargs='?', help='Installed package name')
+    update_parser.add_argument('--all', action='store_true',
+                             help='Update every installed package')
+    update_parser.add_argument('-p', '--parallel', type=int, default=8,
+                             help='Number of concurrent fetches with --all')
+    update_parser.add_argument('--max-builds', type=int, default=2,
+                             help='Number of concurrent builds with --all')
     update_parser.add_argument('-m', '--manual', action='store_true',
                              help='Skip build during update')
+    update_parser.add_argument('-j', '--jobs', type=int,
+                             help='Parallel make jobs (default: available CPUs)')
+    update_parser.add_argument('--in-place', action='store_true',
+                             help='Move the current checkout to the new commit instead of '
+                                  'keeping the previous version (discards local changes)')
+
+    # Outdated command
+    outdated_parser = subparsers.add_parser('outdated',
+                                            help='List packages with newer remote commits or releases')
+    outdated_parser.add_argument('-p', '--parallel', type=int, default=32,
+                                 help='Number of remotes queried concurrently')
+
+    # Switch command
+    switch_parser = subparsers.add_parser('switch',
+                                          help='Switch a package to another installed version')
+    switch_parser.add_argument('package_name', help='Installed package name')
+    switch_parser.add_argument('version', nargs='?',
+                               help='Version to switch to (omit to list installed versions)')
+    switch_parser.add_argument('-m', '--manual', action='store_true',
+                               help='Only switch the checkout, skip the system install')
+
+    # Sync command
+    sync_parser = subparsers.add_parser('sync',
+                                        help='Install, update and remove packages to match a manifest')
+    sync_parser.add_argument('-f', '--file', default='gitstaller.toml',
+                             help='TOML manifest (default: gitstaller.toml)')
+    sync_parser.add_argument('--lockfile',
+                             help='Lockfile of pinned commits (default: manifest name with .lock)')
+    sync_parser.add_argument('--update-lock', action='store_true',
+                             help='Ignore pinned commits and move packages to their latest sources')
+    sync_parser.add_argument('--no-prune', action='store_true',
+                             help='Keep installed packages that are not in the manifest')
+    sync_parser.add_argument('-p', '--parallel', type=int, default=4,
+                             help='Number of concurrent clones and fetches')
+    sync_parser.add_argument('--max-builds', type=int, default=2,
+                             help='Number of concurrent builds')
 
     # Remove command
     remove_parser = subparsers.add_parser('remove', help='Remove a package')
@@ -186,9 +2458,18 @@ def main():
     reinstall_parser.add_argument('package_name', help='Installed package name')
     reinstall_parser.add_argument('-m', '--manual', action='store_true',
                                 help='Skip build during reinstall')
+    reinstall_parser.add_argument('-j', '--jobs', type=int,
+                                help='Parallel make jobs (default: available CPUs)')
 
     args = parser.parse_args()
-    gitstaller = Gitstaller()
+    gitstaller = Gitstaller(use_mirrors=not args.no_mirror, jobs=getattr(args, 'jobs', None),
+                            metadata_backend=args.metadata_backend,
+                            artifact_dir=args.artifact_cache,
+                            use_artifacts=not args.no_artifacts,
+                            use_store=not args.no_store,
+                            ref_cache_ttl=0 if args.refresh else REF_CACHE_TTL,
+                            timeout=args.timeout, per_host=args.per_host,
+                            wheel_dir=args.wheelhouse)
 
     try:
         if args.command == 'install':
@@ -197,10 +2478,47 @@ def main():
                 raise ValueError("--version required when using 'version' source")
             if args.version:
                 source_spec = args.version
-            gitstaller.install(args.repo_url, source=source_spec, manual=args.manual)
+            repo_urls = list(args.repo_urls)
+            if args.manifest:
+                repo_urls.extend(read_manifest(args.manifest))
+            if not repo_urls:
+                raise ValueError("at least one repository URL or --manifest is required")
+            clone = {key: value for key, value in (
+                ('depth', args.depth), ('filter', args.clone_filter),
+                ('single_branch', args.single_branch), ('full', args.full_clone),
+                ('subdir', args.subdir and args.subdir.strip('/'))
+            ) if value}
+            releases = {key: value for key, value in (
+                ('pattern', args.tag_pattern), ('prereleases', args.prereleases)
+            ) if value}
+            if len(repo_urls) == 1:
+                gitstaller.install(repo_urls[0], source=source_spec, manual=args.manual,
+                                   clone=clone, depends=args.depends, releases=releases)
+            else:
+                gitstaller.install_many(repo_urls, source=source_spec, manual=args.manual,
+                                        parallel=args.parallel, max_builds=args.max_builds,
+                                        clone=clone, depends=args.depends, releases=releases)
         
         elif args.command == 'update':
-            gitstaller.update(args.package_name, manual=args.manual)
+            if args.all:
+                gitstaller.update_all(manual=args.manual, parallel=args.parallel,
+                                      max_builds=args.max_builds, in_place=args.in_place)
+            elif args.package_name:
+                gitstaller.update(args.package_name, manual=args.manual,
+                                  in_place=args.in_place)
+            else:
+                raise ValueError("package name or --all required")
+        
+        elif args.command == 'switch':
+            gitstaller.switch(args.package_name, args.version, manual=args.manual)
+        
+        elif args.command == 'outdated':
+            gitstaller.outdated(parallel=args.parallel)
+        
+        elif args.command == 'sync':
+            gitstaller.sync(args.file, args.lockfile, update_lock=args.update_lock,
+                            prune=not args.no_prune, parallel=args.parallel,
+                            max_builds=args.max_builds)
         
         elif args.command == 'remove':
             gitstaller.remove(args.package_name)
@@ -214,5 +2532,10 @@ def main():
     except ValueError as e:
         print(f"❌ Error: {str(e)}")
 
+    if args.timings:
+        gitstaller.timer.write_jsonl(args.timings)
+    if args.trace:
+        gitstaller.timer.write_chrome_trace(args.trace)
+
 if __name__ == "__main__":
     main()
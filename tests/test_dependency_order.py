@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from gitstaller import Gitstaller
+
+
+@pytest.fixture
+def installer(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    return Gitstaller()
+
+
+def run(installer, depends, statuses=None, max_workers=4):
+    """Run a recording task over packages with the given depends; returns (results, events)"""
+    installer._metadata = {name: {'depends': deps} for name, deps in depends.items()}
+    events = []
+    lock = threading.Lock()
+
+    def task(name):
+        with lock:
+            events.append(('start', name))
+        time.sleep(0.01)
+        with lock:
+            events.append(('end', name))
+        return (statuses or {}).get(name, 'updated')
+
+    results = installer._run_in_dependency_order(sorted(depends), task, max_workers)
+    return results, events
+
+
+def test_dependencies_finish_before_dependents_start(installer):
+    depends = {'app': ['lib', 'util'], 'lib': ['base'], 'util': ['base'], 'base': [],
+               'tool': []}
+    results, events = run(installer, depends)
+    assert results == dict.fromkeys(depends, 'updated')
+    for name, deps in depends.items():
+        for dep in deps:
+            assert events.index(('end', dep)) < events.index(('start', name))
+
+
+def test_dependencies_outside_the_batch_are_satisfied(installer):
+    results, _ = run(installer, {'app': ['not-updated']})
+    assert results == {'app': 'updated'}
+
+
+def test_failed_dependency_skips_its_dependents(installer):
+    depends = {'app': ['lib'], 'lib': ['base'], 'base': [], 'tool': []}
+    results, events = run(installer, depends, statuses={'base': 'build failed'})
+    assert results == {'base': 'build failed', 'lib': 'skipped', 'app': 'skipped',
+                       'tool': 'updated'}
+    assert ('start', 'lib') not in events
+    assert ('start', 'app') not in events
+
+
+def test_unchanged_dependency_does_not_skip(installer):
+    results, _ = run(installer, {'app': ['lib'], 'lib': []}, statuses={'lib': 'unchanged'})
+    assert results == {'lib': 'unchanged', 'app': 'updated'}
+
+
+def test_raising_task_counts_as_failed(installer):
+    installer._metadata = {'app': {'depends': ['lib']}, 'lib': {}}
+
+    def task(name):
+        if name == 'lib':
+            raise RuntimeError('boom')
+        return 'updated'
+
+    results = installer._run_in_dependency_order(['app', 'lib'], task, 2)
+    assert results == {'lib': 'failed', 'app': 'skipped'}
+
+
+def test_cycle_fails_without_running(installer):
+    depends = {'a': ['b'], 'b': ['a'], 'c': ['a'], 'd': []}
+    results, events = run(installer, depends)
+    assert results['d'] == 'updated'
+    assert results['a'] == results['b'] == results['c'] == 'failed'
+    assert {name for _, name in events} == {'d'}
@@ -0,0 +1,88 @@
+import os
+import subprocess
+
+import pytest
+
+from gitstaller import _pkt_line, ls_refs_command, ls_refs_request, parse_ls_refs, tag_prefix
+
+COMMIT = 'a' * 40
+TAG = 'b' * 40
+OTHER = 'c' * 40
+
+
+def reply(*sections, end=b''):
+    """pkt-lines of each section, each followed by a flush packet"""
+    return b''.join(b''.join(_pkt_line(line + '\n') for line in section) + b'0000'
+                    for section in sections) + end
+
+
+CAPABILITIES = ['version 2', 'agent=git/2.39.0', 'ls-refs=unborn', 'fetch=shallow']
+
+
+def test_request_frames_prefixes():
+    assert ls_refs_request(['refs/heads/main', 'refs/tags/v']) == (
+        b'0014command=ls-refs\n' b'0001' b'0009peel\n'
+        b'001fref-prefix refs/heads/main\n' b'001bref-prefix refs/tags/v\n' b'0000')
+
+
+@pytest.mark.parametrize('pattern, prefix', [
+    ('v*', 'refs/tags/v'), ('release-[0-9]*', 'refs/tags/release-'), ('*', 'refs/tags/'),
+    (None, 'refs/tags/'),
+])
+def test_tag_prefix(pattern, prefix):
+    assert tag_prefix(pattern) == prefix
+
+
+def test_peeled_tags_map_to_their_commit():
+    output = reply(CAPABILITIES, [
+        f'{COMMIT} refs/heads/main',
+        f'{TAG} refs/tags/v1.0 peeled:{OTHER}',
+        f'{OTHER} refs/tags/v0.9',
+    ])
+    assert parse_ls_refs(output) == {
+        'refs/heads/main': COMMIT, 'refs/tags/v1.0': OTHER, 'refs/tags/v0.9': OTHER}
+
+
+def test_response_end_packet_is_ignored():
+    # git's HTTP helper ends a stateless-connect response with 0002
+    output = reply(CAPABILITIES, [f'{COMMIT} refs/heads/main'], end=b'0002')
+    assert parse_ls_refs(output) == {'refs/heads/main': COMMIT}
+
+
+def test_empty_reply():
+    assert parse_ls_refs(reply(CAPABILITIES, [])) == {}
+
+
+def test_v0_advertisement_raises():
+    output = reply([f'{COMMIT} HEAD\0multi_ack thin-pack side-band symref=HEAD:refs/heads/main',
+                    f'{COMMIT} refs/heads/main'])
+    with pytest.raises(ValueError):
+        parse_ls_refs(output)
+
+
+def test_capabilities_without_ls_refs_reply_raise():
+    with pytest.raises(ValueError):
+        parse_ls_refs(reply(CAPABILITIES))
+
+
+def test_error_line_raises():
+    with pytest.raises(ValueError, match='unknown command'):
+        parse_ls_refs(reply(CAPABILITIES, ['ERR unknown command']))
+
+
+def test_local_upload_pack(tmp_path):
+    repo = tmp_path / 'repo'
+    git = ['git', '-C', str(repo), '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+    subprocess.run(['git', 'init', '-q', '-b', 'main', str(repo)], check=True)
+    subprocess.run([*git, 'commit', '-q', '--allow-empty', '-m', 'one'], check=True)
+    subprocess.run([*git, 'tag', '-a', '-m', 'release', 'v1.0'], check=True)
+    subprocess.run([*git, 'tag', 'other'], check=True)
+    head = subprocess.run([*git, 'rev-parse', 'HEAD'], check=True, capture_output=True,
+                          text=True).stdout.strip()
+
+    args, handshake = ls_refs_command(f'file://{repo}')
+    assert handshake is None
+    output = subprocess.run(args, input=ls_refs_request(['refs/heads/', 'refs/tags/v']),
+                            capture_output=True, check=True,
+                            env=dict(os.environ, GIT_PROTOCOL='version=2')).stdout
+    assert parse_ls_refs(output) == {'refs/heads/main': head, 'refs/tags/v1.0': head}
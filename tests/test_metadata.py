@@ -0,0 +1,60 @@
+import pytest
+
+from gitstaller import Gitstaller
+
+
+def entry(name, commit='0' * 40):
+    return {'url': f'https://example.com/{name}.git', 'source': 'main', 'manual': False,
+            'commit': commit}
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    return request.param
+
+
+def test_concurrent_instances_keep_each_others_packages(backend):
+    first = Gitstaller(metadata_backend=backend)
+    second = Gitstaller(metadata_backend=backend)
+    # Both load before either writes, like two gitstaller processes started together
+    assert first.metadata == second.metadata == {}
+    first._set_package('alpha', entry('alpha'))
+    second._set_package('beta', entry('beta'))
+    assert Gitstaller(metadata_backend=backend).metadata == {
+        'alpha': entry('alpha'), 'beta': entry('beta')}
+
+
+def test_removal_only_drops_that_package(backend):
+    seed = Gitstaller(metadata_backend=backend)
+    seed._set_package('alpha', entry('alpha'))
+    seed._set_package('beta', entry('beta'))
+
+    first = Gitstaller(metadata_backend=backend)
+    second = Gitstaller(metadata_backend=backend)
+    first.metadata, second.metadata
+    first._set_package('alpha', None)
+    second._set_package('beta', entry('beta', '1' * 40))
+    assert Gitstaller(metadata_backend=backend).metadata == {'beta': entry('beta', '1' * 40)}
+
+
+def test_batched_changes_are_merged_at_the_end(backend):
+    first = Gitstaller(metadata_backend=backend)
+    second = Gitstaller(metadata_backend=backend)
+    with first._batched_metadata():
+        first._set_package('alpha', entry('alpha'))
+        first._set_package('gamma', entry('gamma'))
+        second._set_package('beta', entry('beta'))
+    assert sorted(Gitstaller(metadata_backend=backend).metadata) == ['alpha', 'beta', 'gamma']
+
+
+def test_single_package_lookup_sees_unsaved_and_stored_entries(backend):
+    Gitstaller(metadata_backend=backend)._set_package('alpha', entry('alpha'))
+    installer = Gitstaller(metadata_backend=backend)
+    assert installer._get_package('alpha') == entry('alpha')
+    assert installer._get_package('beta') is None
+    assert installer._metadata is None  # no full load
+
+    installer._set_package('beta', entry('beta'))
+    installer._set_package('alpha', None)
+    assert installer.metadata == {'beta': entry('beta')}
@@ -0,0 +1,55 @@
+import os
+import subprocess
+
+import pytest
+
+from gitstaller import Gitstaller
+
+
+def git(repo, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                    *args], cwd=repo, check=True, capture_output=True)
+
+
+def commit_message(repo, text):
+    (repo / 'message.txt').write_text(text + '\n')
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-m', text)
+
+
+@pytest.fixture
+def prefix(tmp_path, monkeypatch):
+    """Install into a scratch prefix through a passthrough sudo"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'sudo').write_text('#!/bin/sh\nexec "$@"\n')
+    (bin_dir / 'sudo').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('PREFIX', str(tmp_path / 'prefix'))
+    return tmp_path / 'prefix'
+
+
+def test_update_to_reverted_content_rebuilds(tmp_path, prefix):
+    repo = tmp_path / 'hello'
+    repo.mkdir()
+    git(repo, 'init', '-q', '-b', 'main')
+    (repo / 'Makefile').write_text(
+        "all: out.txt\n"
+        "out.txt: message.txt\n\tcp message.txt out.txt\n"
+        "install:\n\tmkdir -p $(PREFIX)\n\tcp out.txt $(PREFIX)/hello.txt\n")
+    commit_message(repo, 'A')
+
+    def gitstaller():
+        # A fresh instance per step, like separate CLI runs
+        return Gitstaller(use_mirrors=False, use_artifacts=False, ref_cache_ttl=0)
+
+    assert gitstaller().install(f"file://{repo}") == 'installed'
+    commit_message(repo, 'B')
+    assert gitstaller().update('hello') == 'updated'
+    assert (prefix / 'hello.txt').read_text() == 'B\n'
+
+    # Reverting brings back content whose stored copy predates the last build
+    commit_message(repo, 'A')
+    assert gitstaller().update('hello') == 'updated'
+    assert (prefix / 'hello.txt').read_text() == 'A\n'
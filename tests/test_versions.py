@@ -0,0 +1,47 @@
+import pytest
+
+from gitstaller import latest_version, version_key
+
+
+@pytest.mark.parametrize('tag', [
+    'v1', 'V2', '1.0', 'v1.2.0', 'release-1.2', 'foo/v1.3', 'pkg-v2', 'release1.0',
+])
+def test_release_tags_are_versions(tag):
+    assert version_key(tag) is not None
+
+
+@pytest.mark.parametrize('tag', [
+    'nightly', 'nightly-20240101', 'build42', 'ci-build-318', 'R_2_1', 'dev42', '2',
+    'v1.0-linux',
+])
+def test_non_release_tags_are_not_versions(tag):
+    assert version_key(tag) is None
+
+
+def test_pep440_ordering():
+    ordered = ['1.0.dev1', '1.0a1', '1.0b2', '1.0rc1', '1.0', '1.0.post1', '1.1']
+    keys = [version_key(tag)[0] for tag in ordered]
+    assert keys == sorted(keys)
+    assert version_key('1.0')[0] == version_key('v1.0.0')[0]
+
+
+def test_prerelease_flag():
+    assert version_key('v2.0.0-rc.1')[1]
+    assert not version_key('v2.0.0')[1]
+
+
+def test_latest_version_ignores_build_tags():
+    assert latest_version(['v1.2.0', 'v1.3.1', 'nightly-20240101']) == 'v1.3.1'
+    assert latest_version(['build42', 'ci-build-318', 'R_2_1', 'v0.9']) == 'v0.9'
+
+
+def test_latest_version_compares_numerically():
+    assert latest_version(['v1.2', 'v1.10', 'v1.9']) == 'v1.10'
+
+
+def test_latest_version_prereleases_and_pattern():
+    tags = ['v1.0', 'v1.1rc1', 'lib-2.0', 'lib-2.1']
+    assert latest_version(tags) == 'lib-2.1'
+    assert latest_version(tags, pattern='v*') == 'v1.0'
+    assert latest_version(tags, pattern='v*', prereleases=True) == 'v1.1rc1'
+    assert latest_version(['nightly-1']) is None
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from gitstaller import Gitstaller
+
+pytest.importorskip('wheel')
+pytest.importorskip('setuptools')
+
+
+def git(repo, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                    *args], cwd=repo, check=True, capture_output=True)
+
+
+def commit_module(repo, value):
+    with open(os.path.join(repo, 'demo.py'), 'w') as f:
+        f.write(f"VALUE = {value}\n")
+    git(repo, 'add', '-A')
+    git(repo, 'commit', '-m', f"value {value}")
+
+
+@pytest.fixture
+def python3(tmp_path, monkeypatch):
+    """Put a passthrough sudo and a throwaway python3 environment on PATH"""
+    subprocess.run([sys.executable, '-m', 'venv', '--without-pip', '--system-site-packages',
+                    str(tmp_path / 'venv')], check=True)
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'sudo').write_text('#!/bin/sh\nexec "$@"\n')
+    (bin_dir / 'sudo').chmod(0o755)
+    # A symlink would not be recognized as the venv's interpreter
+    (bin_dir / 'python3').write_text(f'#!/bin/sh\nexec {tmp_path}/venv/bin/python "$@"\n')
+    (bin_dir / 'python3').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    # Build with the setuptools and wheel already installed, without an index
+    monkeypatch.setenv('PIP_NO_BUILD_ISOLATION', '0')
+    monkeypatch.setenv('PIP_NO_INDEX', '1')
+    monkeypatch.setenv('PIP_DISABLE_PIP_VERSION_CHECK', '1')
+    return str(bin_dir / 'python3')
+
+
+def test_new_commit_with_same_version_is_installed(tmp_path, python3):
+    repo = tmp_path / 'demo'
+    repo.mkdir()
+    git(repo, 'init', '-q', '-b', 'main')
+    (repo / 'setup.py').write_text(textwrap.dedent("""\
+        from setuptools import setup
+        setup(name='demo', version='1.0', py_modules=['demo'])
+    """))
+    commit_module(repo, 1)
+
+    gitstaller = Gitstaller(use_mirrors=False, ref_cache_ttl=0)
+    assert gitstaller.install(f"file://{repo}") == 'installed'
+    commit_module(repo, 2)
+    assert gitstaller.update('demo') == 'updated'
+
+    wheelhouses = os.listdir(gitstaller.wheel_dir)
+    assert len(wheelhouses) == 2
+    installed = subprocess.run([python3, '-c', 'import demo; print(demo.VALUE, demo.__file__)'],
+                               cwd=tmp_path, capture_output=True, text=True, check=True)
+    value, path = installed.stdout.split()
+    assert value == '2'
+    assert path.startswith(str(tmp_path / 'venv'))